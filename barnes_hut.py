@@ -0,0 +1,241 @@
+"""
+Barnes-Hut quadtree gravity, O(N log N) per evaluation.
+
+Distant groups of bodies are approximated by their total mass placed
+in their centre of mass. A cell of side s at distance d is used as a
+whole when s/d < theta, otherwise it is opened. Cells with only a few
+bodies are summed directly with the same rule as forces.direct, so
+theta = 0 gives the direct sum.
+
+The tree is built level by level from Morton keys and traversed for
+a chunk of bodies at a time, so that everything stays vectorized.
+
+Run this file to print an accuracy report against the direct sum.
+"""
+
+import sys
+import time as timer
+
+import numpy as np
+
+import forces
+from forces import G, MIN_DISTANCE
+
+
+# Opening angle, larger is faster and less accurate.
+THETA = 0.5
+# Cells with at most this many bodies are summed directly.
+LEAF_SIZE = 8
+# Deepest level of the tree, the root side is split in 2^DEPTH cells.
+DEPTH = 16
+# Number of bodies traversed together, bounds the traversal memory.
+CHUNK = 4096
+
+
+def interleave(x):
+    """Spreads the 16 lowest bits of x to every other bit."""
+    x = x & 0xFFFF
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    x = (x | (x << 1)) & 0x55555555
+    return x
+
+def ranks(counts):
+    """[0, 1, .., counts[0]-1, 0, 1, .., counts[1]-1, ...]"""
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(offsets, counts)
+
+
+class Tree():
+    def __init__(self, pos, mass, leaf_size=LEAF_SIZE, depth=DEPTH):
+        """
+        Sorts the bodies along a Morton curve and sets up the nodes:
+        start, count (the range of sorted bodies inside the node),
+        node_mass, com (centre of mass), center, size,
+        first_child, n_children and is_leaf.
+        """
+        n = len(pos)
+        # The root is the smallest square enclosing all bodies.
+        self.origin = complex(pos.real.min(), pos.imag.min())
+        side = max(pos.real.max() - self.origin.real,
+                   pos.imag.max() - self.origin.imag)
+        side = side*(1 + 1e-9) or 1.0
+        cells = 2**depth
+        ix = np.minimum(((pos.real - self.origin.real)/side*cells)
+                        .astype(np.int64), cells - 1)
+        iy = np.minimum(((pos.imag - self.origin.imag)/side*cells)
+                        .astype(np.int64), cells - 1)
+        key = interleave(ix) | (interleave(iy) << 1)
+
+        self.order = np.argsort(key, kind='stable')
+        self.pos = pos[self.order]
+        self.mass = mass[self.order]
+        key, ix, iy = key[self.order], ix[self.order], iy[self.order]
+
+        # Level 0 is the root, holding every body.
+        start, count, level = [np.zeros(1, np.int64)], [np.array([n])], [0]
+        first_child, n_children = [], []
+        cell = np.zeros(1, np.int64)
+        active = np.arange(n)  # sorted bodies inside the current level
+        n_nodes = 1
+        for l in range(1, depth + 1):
+            opened = count[-1] > leaf_size
+            if not opened.any():
+                break
+            # Only bodies of opened cells are split further.
+            active = active[np.repeat(opened, count[-1])]
+            child_cell = key[active] >> 2*(depth - l)
+            first = np.flatnonzero(np.r_[True,
+                                         child_cell[1:] != child_cell[:-1]])
+            new_start = active[first]
+            new_count = np.diff(np.r_[first, len(active)])
+            new_cell = child_cell[first]
+            # Children of a cell are next to each other, in order.
+            parent = new_cell >> 2
+            left = np.searchsorted(parent, cell, 'left')
+            right = np.searchsorted(parent, cell, 'right')
+            first_child.append(np.where(opened, n_nodes + left, 0))
+            n_children.append(np.where(opened, right - left, 0))
+
+            start.append(new_start)
+            count.append(new_count)
+            level.append(l)
+            cell = new_cell
+            n_nodes += len(new_start)
+        first_child.append(np.zeros(len(cell), np.int64))
+        n_children.append(np.zeros(len(cell), np.int64))
+
+        self.level = np.concatenate([np.full(len(s), l)
+                                     for s, l in zip(start, level)])
+        self.start = np.concatenate(start)
+        self.count = np.concatenate(count)
+        self.first_child = np.concatenate(first_child)
+        self.n_children = np.concatenate(n_children)
+        self.is_leaf = self.n_children == 0
+
+        # Geometry, from the cell of the first body in each node.
+        self.size = side / 2.0**self.level
+        shift = depth - self.level
+        cx = (ix[self.start] >> shift) + 0.5
+        cy = (iy[self.start] >> shift) + 0.5
+        self.center = self.origin + (cx + cy*1j)*self.size
+
+        # Mass and centre of mass, from running sums over the
+        # sorted bodies. Positions are taken relative to the origin.
+        rel = self.pos - self.origin
+        mass_sum = np.r_[0, np.cumsum(self.mass)]
+        moment_sum = np.r_[0, np.cumsum(self.mass*rel)]
+        end = self.start + self.count
+        self.node_mass = mass_sum[end] - mass_sum[self.start]
+        moment = moment_sum[end] - moment_sum[self.start]
+        massless = self.node_mass <= 0
+        self.com = self.origin + moment / np.where(massless, 1,
+                                                   self.node_mass)
+        self.com[massless] = self.center[massless]
+
+    def accelerations(self, G=G, min_distance=MIN_DISTANCE, theta=THETA,
+                      chunk=CHUNK):
+        """Acceleration of every body, in the original order."""
+        n = len(self.pos)
+        acc = np.zeros(n, complex)
+        for a in range(0, n, chunk):
+            b = min(a + chunk, n)
+            acc[self.order[a:b]] = self.walk(a, b, G, min_distance, theta)
+        return acc
+
+    def walk(self, a, b, G, min_distance, theta):
+        """
+        Traverses the tree for the sorted bodies a..b-1, keeping every
+        pending (body, node) pair in two arrays, one level at a time.
+        """
+        re = np.zeros(b - a)
+        im = np.zeros(b - a)
+
+        def add(body, diff, mass):
+            # Same rule as forces.direct: a_i = G*m_j/d^2 towards j
+            distance = np.abs(diff)
+            pull = distance > min_distance
+            scale = G*mass[pull] / distance[pull]**3
+            step = scale*diff[pull]
+            re[:] += np.bincount(body[pull] - a, step.real, b - a)
+            im[:] += np.bincount(body[pull] - a, step.imag, b - a)
+
+        body = np.arange(a, b)
+        node = np.zeros(b - a, np.int64)
+        while len(body):
+            pos = self.pos[body]
+            diff = self.com[node] - pos
+            # A cell is never approximated for a body inside it.
+            offset = self.center[node] - pos
+            half = self.size[node]/2
+            inside = (np.abs(offset.real) <= half) & \
+                     (np.abs(offset.imag) <= half)
+            far = ~inside & (self.size[node] < theta*np.abs(diff))
+            add(body[far], diff[far], self.node_mass[node[far]])
+
+            # Near leaves: sum over the bodies in them.
+            leaf = ~far & self.is_leaf[node]
+            counts = self.count[node[leaf]]
+            members = np.repeat(self.start[node[leaf]], counts) + \
+                      ranks(counts)
+            targets = np.repeat(body[leaf], counts)
+            add(targets, self.pos[members] - self.pos[targets],
+                self.mass[members])
+
+            # Near cells: open them.
+            opened = ~far & ~self.is_leaf[node]
+            counts = self.n_children[node[opened]]
+            body = np.repeat(body[opened], counts)
+            node = np.repeat(self.first_child[node[opened]], counts) + \
+                   ranks(counts)
+        return re + im*1j
+
+
+def accelerations(pos, mass, G=G, min_distance=MIN_DISTANCE, theta=THETA,
+                  leaf_size=LEAF_SIZE):
+    """
+    Barnes-Hut force backend, same call as forces.direct.
+    The tree is rebuilt on every call.
+    """
+    if not len(pos):
+        return np.zeros(0, complex)
+    return Tree(pos, mass, leaf_size).accelerations(G, min_distance, theta)
+
+
+def accuracy_report(n=2000, thetas=(0.3, 0.5, 0.7, 1.0), sample=1000,
+                    seed=0):
+    """
+    Prints the error of the Barnes-Hut accelerations relative to
+    the direct sum for n bodies spread uniformly on a disk.
+    The direct sum is only computed for a sample of the bodies.
+    """
+    rng = np.random.RandomState(seed)
+    r = 350*np.sqrt(rng.uniform(0, 1, n))
+    pos = 400+400j + r*np.exp(2j*np.pi*rng.uniform(0, 1, n))
+    mass = rng.uniform(2, 5, n)**2*np.pi
+    targets = rng.choice(n, min(sample, n), replace=False)
+
+    t = timer.time()
+    exact = forces.direct(pos, mass, targets=targets)
+    t_direct = (timer.time() - t) * n/len(targets)
+
+    print("Barnes-Hut vs direct sum, %d bodies" % n)
+    print("direct sum: %.3f s (estimated)" % t_direct)
+    print("Relative error per body, and of all bodies (rms)")
+    print("%6s %10s %10s %10s %10s %10s %8s"
+          % ('theta', 'median', '99%', 'max', 'rms', 'time [s]', 'speedup'))
+    for theta in thetas:
+        t = timer.time()
+        approx = accelerations(pos, mass, theta=theta)
+        t_tree = timer.time() - t
+        error = np.abs(approx[targets] - exact)
+        rms = np.sqrt(np.mean(error**2) / np.mean(np.abs(exact)**2))
+        error /= np.abs(exact)
+        print("%6.2f %10.2e %10.2e %10.2e %10.2e %10.3f %8.1f"
+              % (theta, np.median(error), np.percentile(error, 99),
+                 error.max(), rms, t_tree, t_direct/t_tree))
+
+
+if __name__ == '__main__':
+    accuracy_report(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,176 @@
+"""
+Many small, independent simulations stepped together.
+
+For a scene of a few bodies the work of a step is a handful of numpy
+calls on tiny arrays, and the interpreter overhead is all there is.
+Batch stacks B such universes along a leading axis, every quantity an
+array of shape (B, N), so that one step of all of them is one set of
+array operations on (B, N, N) pairs.
+
+Universes with fewer than N bodies are padded, and merged bodies stay
+in place, with alive False and no mass: they neither pull nor move.
+Every universe has its own G. The integrator is velocity Verlet, as in
+engine.Simulation, with the same collisions; there is no edge bounce.
+"""
+
+import numpy as np
+
+from bodies import Bodies
+import engine
+import forces
+
+
+# Universes handled at once, so that the pair arrays stay within
+# about CHUNK entries
+CHUNK = 2**20
+
+
+def accelerations(pos, mass, G, min_distance=forces.MIN_DISTANCE):
+    """
+    The accelerations (B, N) of the universes pos and mass, (B, N),
+    with G of shape (B,). Same rules as forces.direct.
+    """
+    acc = np.zeros(pos.shape, complex)
+    B, N = pos.shape
+    step = max(1, CHUNK // (N*N))
+    for a in range(0, B, step):
+        b = min(a + step, B)
+        # diff[u, i, j] = pos[u, j] - pos[u, i], the vector from i to j
+        diff = pos[a:b, np.newaxis, :] - pos[a:b, :, np.newaxis]
+        distance = np.abs(diff)
+        near = distance <= min_distance
+        distance[near] = 1
+        scale = mass[a:b, np.newaxis, :] / distance**3
+        scale[near] = 0
+        acc[a:b] = G[a:b, np.newaxis]*(scale*diff).sum(axis=2)
+    return acc
+
+def overlapping_pairs(pos, radius, alive):
+    """
+    The overlapping pairs of live bodies of every universe, as
+    indices (i, j) into the flattened (B*N) arrays, i < j.
+    """
+    B, N = pos.shape
+    upper = np.triu(np.ones((N, N), bool), 1)
+    p1, p2 = [], []
+    step = max(1, CHUNK // (N*N))
+    for a in range(0, B, step):
+        b = min(a + step, B)
+        distance = np.abs(pos[a:b, np.newaxis, :] - pos[a:b, :, np.newaxis])
+        touch = distance < radius[a:b, np.newaxis, :] + \
+                           radius[a:b, :, np.newaxis]
+        touch &= alive[a:b, np.newaxis, :] & alive[a:b, :, np.newaxis]
+        touch &= upper
+        u, i, j = np.nonzero(touch)
+        p1.append((a + u)*N + i)
+        p2.append((a + u)*N + j)
+    return np.concatenate(p1), np.concatenate(p2)
+
+
+class Batch():
+    def __init__(self, universes, G=forces.G):
+        """
+        Stacks universes, a list of Bodies, each with its own G if G
+        is a sequence.
+        """
+        B = len(universes)
+        N = max([len(bodies) for bodies in universes] + [1])
+        self.pos = np.zeros((B, N), complex)
+        self.vel = np.zeros((B, N), complex)
+        self.acc = np.zeros((B, N), complex)
+        self.mass = np.zeros((B, N))
+        self.radius = np.zeros((B, N))
+        self.color = np.zeros((B, N, 3))
+        self.is_fixed = np.zeros((B, N), bool)
+        self.id = np.zeros((B, N), np.int64)
+        self.alive = np.zeros((B, N), bool)
+        for u, bodies in enumerate(universes):
+            n = len(bodies)
+            for name in Bodies.fields:
+                getattr(self, name)[u, :n] = getattr(bodies, name)
+            self.alive[u, :n] = True
+        self.G = np.broadcast_to(np.asarray(G, float), (B,)).copy()
+        self.min_distance = forces.MIN_DISTANCE
+        self.exists_gravity = True
+        self.exists_collision = True
+        self.time = 0
+        # bodies.acc has to be computed before the first step.
+        self.acc_valid = False
+
+    @classmethod
+    def of(cls, scene, B, n=2, G=forces.G):
+        """
+        B universes set up by scene(sim, n, seed) of scenes.py, with
+        the seeds 0 .. B-1.
+        """
+        universes = []
+        for seed in range(B):
+            sim = engine.Simulation(G=G, seed=seed)
+            scene(sim, n, seed)
+            universes.append(sim.bodies)
+        return cls(universes, G)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def count(self):
+        """The number of live bodies in every universe."""
+        return self.alive.sum(axis=1)
+
+    def bodies(self, u):
+        """The live bodies of universe u, as Bodies."""
+        bodies = Bodies()
+        live = self.alive[u]
+        for name in Bodies.fields:
+            setattr(bodies, name, getattr(self, name)[u, live].copy())
+        bodies.next_id = self.id[u, live].max() + 1 if live.any() else 0
+        return bodies
+
+    def accel(self, pos):
+        if not self.exists_gravity:
+            return np.zeros(pos.shape, complex)
+        return accelerations(pos, self.mass, self.G, self.min_distance)
+
+    def step(self, dt):
+        """One velocity Verlet step of every universe, then collisions."""
+        if not self.acc_valid:
+            self.acc = self.accel(self.pos)
+        free = self.alive & ~self.is_fixed
+        acc = self.acc
+        self.pos += np.where(free, self.vel*dt + acc*dt**2/2.0, 0)
+        self.acc = self.accel(self.pos)
+        self.vel += np.where(free, (acc + self.acc)*dt/2.0, 0)
+        self.acc_valid = True
+        if self.exists_collision and self.collide():
+            self.acc_valid = False
+        self.time += dt
+
+    def run(self, n, dt):
+        for count in range(n):
+            self.step(dt)
+
+    def collide(self):
+        """
+        Merges the overlapping bodies of every universe, like
+        engine.body_collision. Returns the number of consumed bodies.
+        """
+        p1, p2 = overlapping_pairs(self.pos, self.radius, self.alive)
+        if not len(p1):
+            return 0
+        # ravel() of the contiguous arrays are views, merged in place.
+        consumed = engine.merge(self.mass.ravel(), self.vel.ravel(),
+                                self.radius.ravel(), p1, p2)
+        for array in (self.alive, self.mass, self.vel, self.acc):
+            array.ravel()[consumed] = 0
+        return len(consumed)
+
+    def energy(self):
+        """The total energy of every universe."""
+        kinetic = 0.5*np.sum(self.mass*np.abs(self.vel)**2, axis=1)
+        potential = np.zeros(len(self))
+        for i in range(self.pos.shape[1]):
+            distance = np.abs(self.pos[:, i + 1:] - self.pos[:, i:i + 1])
+            distance = np.maximum(distance, self.min_distance)
+            potential -= self.mass[:, i]*np.sum(self.mass[:, i + 1:]/distance,
+                                                axis=1)
+        return kinetic + self.G*potential
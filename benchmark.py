@@ -0,0 +1,157 @@
+"""
+Step throughput benchmark, headless.
+
+For every scene, body count, force backend and integrator a fresh
+simulation is seeded and stepped for a while, and one line of results
+is printed. With --output the results are also appended as JSON lines,
+so that runs on different revisions can be compared.
+
+    python benchmark.py --sizes 10 100 1000 --backends direct barnes_hut
+        --integrators verlet rk4 --output bench.jsonl
+
+Collisions are off so that the body count stays fixed. Per run:
+    steps/s          steps per second of wall time
+    pairs/s          body pairs evaluated per second, N*(N-1)/2 for
+                     every force evaluation, whatever the backend
+    peak memory      the most memory allocated at once (tracemalloc),
+                     in a separate pass so it does not slow the timing
+    energy drift     relative change of the total energy after a fixed
+                     number of steps (--drift-steps)
+    momentum drift   change of the total momentum after those steps,
+                     relative to the sum of |m*v|
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time as timer
+import tracemalloc
+
+import numpy as np
+
+import diagnostics
+import engine
+import forces
+from integrators import INTEGRATORS
+from scenes import SCENES
+
+
+def setup(scene, n, backend, integrator, seed):
+    """A fresh simulation of the scene, without collisions."""
+    sim = engine.Simulation(force_backend=backend, integrator=integrator,
+                            seed=seed)
+    sim.exists_collision = False
+    SCENES[scene][0](sim, n, seed)
+    return sim
+
+def run(scene, n, backend, integrator, dt=1/600., seconds=1.0,
+        max_steps=1000, drift_steps=100, memory_steps=2, seed=0):
+    """
+    Benchmarks one combination and returns the results as a dict.
+    Each measure starts from the same seeded scene: the timing runs
+    for seconds, the peak memory is traced over memory_steps untimed
+    steps, and the drift is taken after exactly drift_steps steps so
+    that it compares across machines and backends.
+    """
+    sim = setup(scene, n, backend, integrator, seed)
+    count = len(sim.bodies)
+
+    # Count the force evaluations.
+    evaluations = [0]
+    force = sim.force
+    def counted(*args, **kwargs):
+        evaluations[0] += 1
+        return force(*args, **kwargs)
+    sim.force = counted
+
+    steps = 0
+    t = timer.time()
+    while steps < max_steps and (steps == 0 or timer.time() - t < seconds):
+        sim.step(dt)
+        steps += 1
+    t = timer.time() - t
+
+    # tracemalloc slows every allocation down, so not while timing.
+    sim = setup(scene, n, backend, integrator, seed)
+    tracemalloc.start()
+    for step in range(memory_steps):
+        sim.step(dt)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sim = setup(scene, n, backend, integrator, seed)
+    energy = diagnostics.energy(sim.bodies, sim.G)
+    momentum = diagnostics.momentum(sim.bodies)
+    scale = np.sum(sim.bodies.mass*np.abs(sim.bodies.vel)) or 1.0
+    for step in range(drift_steps):
+        sim.step(dt)
+    energy_drift = abs(diagnostics.energy(sim.bodies, sim.G)/energy - 1) \
+                   if energy else 0.0
+    momentum_drift = abs(diagnostics.momentum(sim.bodies) - momentum)/scale
+    return dict(scene=scene, n=count, backend=backend, integrator=integrator,
+                dt=dt, steps=steps, seconds=t,
+                steps_per_second=steps/t,
+                pairs_per_second=evaluations[0]*count*(count - 1)/2./t,
+                peak_memory=peak,
+                drift_steps=drift_steps,
+                energy_drift=energy_drift,
+                momentum_drift=momentum_drift)
+
+def machine():
+    """What the results were measured on."""
+    return dict(python=platform.python_version(), numpy=np.__version__,
+                platform=platform.platform(),
+                processor=platform.processor() or platform.machine(),
+                date=timer.strftime('%Y-%m-%dT%H:%M:%S'))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scenes', nargs='+', default=sorted(SCENES),
+                        choices=sorted(SCENES))
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[10, 100, 1000])
+    parser.add_argument('--backends', nargs='+', default=['direct'],
+                        choices=sorted(forces.BACKENDS))
+    parser.add_argument('--integrators', nargs='+', default=['verlet'],
+                        choices=sorted(INTEGRATORS))
+    parser.add_argument('--seconds', type=float, default=1.0,
+                        help="wall time per run, at least one step")
+    parser.add_argument('--drift-steps', type=int, default=100,
+                        help="steps before the drift is measured")
+    parser.add_argument('--dt', type=float, default=1/600.)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="append JSON lines to this file")
+    args = parser.parse_args(argv)
+
+    info = machine()
+    print("%-14s %7s %-11s %-16s %10s %10s %10s %10s %10s"
+          % ('scene', 'n', 'backend', 'integrator', 'steps/s', 'pairs/s',
+             'peak MB', 'energy', 'momentum'))
+    for scene in args.scenes:
+        # The fixed scenes are run once, whatever the sizes.
+        sizes = args.sizes if SCENES[scene][1] else [None]
+        for n in sizes:
+            for backend in args.backends:
+                for integrator in args.integrators:
+                    result = run(scene, n, backend, integrator, args.dt,
+                                 args.seconds,
+                                 drift_steps=args.drift_steps, seed=args.seed)
+                    print("%-14s %7d %-11s %-16s %10.1f %10.3g %10.1f "
+                          "%10.2e %10.2e"
+                          % (scene, result['n'], backend, integrator,
+                             result['steps_per_second'],
+                             result['pairs_per_second'],
+                             result['peak_memory']/2.0**20,
+                             result['energy_drift'],
+                             result['momentum_drift']))
+                    sys.stdout.flush()
+                    if args.output:
+                        result.update(info)
+                        with open(args.output, 'a') as f:
+                            f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
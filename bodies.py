@@ -0,0 +1,65 @@
+"""
+Structure-of-arrays state for a set of bodies.
+
+All positions in the 2d plane are represented by complex numbers,
+here as one numpy complex array per quantity, indexed by body.
+"""
+
+import numpy as np
+from math import pi
+
+
+class Bodies():
+    # Every per-body array, used when bodies are added or removed.
+    fields = ('pos', 'vel', 'acc', 'mass', 'radius',
+              'color', 'is_fixed', 'id')
+
+    def __init__(self, n=0):
+        """
+        Sets up n bodies at the origin:
+        pos, vel, acc, mass, radius, color, is_fixed, id.
+        """
+        self.pos = np.zeros(n, complex)
+        self.vel = np.zeros(n, complex)
+        self.acc = np.zeros(n, complex)
+
+        self.mass = np.zeros(n)
+        self.radius = np.zeros(n)
+
+        self.color = np.ones((n, 3))
+
+        self.is_fixed = np.zeros(n, bool)
+
+        # Stable body ids, these survive the removal of other bodies.
+        self.id = np.arange(n)
+        self.next_id = n
+
+    def __len__(self):
+        return len(self.pos)
+
+    def append(self, pos=0, vel=0, radius=20, mass=None,
+               color=(1, 1, 1), is_fixed=False):
+        """
+        Adds a body and returns its id, or several bodies and their ids
+        if pos is an array; the other arguments are then broadcast.
+        The mass defaults to the area of the body, mass = radius^2*pi.
+        """
+        if mass is None:
+            mass = np.square(radius)*pi
+        k = np.size(pos)
+        ids = np.arange(self.next_id, self.next_id + k)
+        new = dict(pos=pos, vel=vel, acc=0, mass=mass, radius=radius,
+                   color=color, is_fixed=is_fixed, id=ids)
+        for name in self.fields:
+            old = getattr(self, name)
+            value = np.broadcast_to(new[name], (k,) + old.shape[1:])
+            setattr(self, name, np.append(old, value, axis=0))
+        self.next_id += k
+        return ids if np.ndim(pos) else ids[0]
+
+    def remove(self, indices):
+        """Removes the bodies at the given array indices."""
+        keep = np.ones(len(self), bool)
+        keep[indices] = False
+        for name in self.fields:
+            setattr(self, name, getattr(self, name)[keep])
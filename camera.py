@@ -0,0 +1,79 @@
+"""
+The view onto the simulation: pan, zoom and following a body.
+
+The physics runs in its own units, the camera maps them to pixels:
+    screen = (world - centre)*zoom + middle of the window
+The mapping is applied once per frame as a GL transform around the
+drawing of the bodies, so nothing in the physics or the vertex arrays
+knows about pixels. Text and the mouse stay in pixels and go through
+to_screen() and to_world().
+"""
+
+import numpy as np
+
+from pyglet.gl import *
+
+
+class Camera():
+    def __init__(self, centre=0j, zoom=1.0, width=800, height=800):
+        """Looks at centre, zoom pixels per unit, in a window of the size."""
+        self.centre = complex(centre)
+        self.zoom = zoom
+        self.width = width
+        self.height = height
+        # The id of the followed body, or None
+        self.follow = None
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+    def middle(self):
+        """The middle of the window, in pixels."""
+        return self.width/2. + self.height/2.*1j
+
+    def to_screen(self, pos):
+        """Pixel positions (complex) of world positions."""
+        return (pos - self.centre)*self.zoom + self.middle()
+
+    def to_world(self, x, y):
+        """The world position under the pixel x, y."""
+        return (x + y*1j - self.middle())/self.zoom + self.centre
+
+    def view(self):
+        """The visible area in world units, (left, bottom, right, top)."""
+        low = self.to_world(0, 0)
+        high = self.to_world(self.width, self.height)
+        return low.real, low.imag, high.real, high.imag
+
+    def pan(self, dx, dy):
+        """Moves the view by dx, dy pixels and stops following."""
+        self.centre -= (dx + dy*1j)/self.zoom
+        self.follow = None
+
+    def zoom_at(self, x, y, factor):
+        """Zooms by factor, keeping the point under x, y in place."""
+        fixed = self.to_world(x, y)
+        self.zoom *= factor
+        self.centre = fixed - (x + y*1j - self.middle())/self.zoom
+
+    def track(self, bodies):
+        """Centres on the followed body, until it is gone."""
+        if self.follow is None:
+            return
+        where = np.flatnonzero(bodies.id == self.follow)
+        if len(where):
+            self.centre = complex(bodies.pos[where[0]])
+        else:
+            self.follow = None
+
+    def begin(self):
+        """Starts drawing in world units."""
+        glPushMatrix()
+        glTranslatef(self.width/2., self.height/2., 0)
+        glScalef(self.zoom, self.zoom, 1)
+        glTranslatef(-self.centre.real, -self.centre.imag, 0)
+
+    def end(self):
+        """Back to drawing in pixels."""
+        glPopMatrix()
@@ -0,0 +1,111 @@
+"""
+Checkpoints: the state of a simulation in one binary file.
+
+The file is a 64 byte header followed by one column per quantity,
+all float64 except the ids:
+    pos (complex), vel (complex), mass, radius, is_fixed (0 or 1),
+    color (n x 3), id (int64)
+Files are written to a temporary name and renamed, so a checkpoint is
+either complete or not there at all. Loading maps the columns with
+numpy.memmap (copy-on-write), so even millions of bodies restart at
+once and are only read from disk as they are touched.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+from bodies import Bodies
+
+
+MAGIC = b'NBODYCK2'
+# magic, n, next_id, time, G, min_distance, length (adaptive timesteps)
+HEADER = struct.Struct('<8sqqdddd')
+# The first version, without min_distance and length
+MAGIC_1 = b'NBODYCK1'
+HEADER_1 = struct.Struct('<8sqqdd')
+HEADER_SIZE = 64
+
+# name, dtype, values per body
+COLUMNS = (
+    ('pos', np.complex128, 1),
+    ('vel', np.complex128, 1),
+    ('mass', np.float64, 1),
+    ('radius', np.float64, 1),
+    ('is_fixed', np.float64, 1),
+    ('color', np.float64, 3),
+    ('id', np.int64, 1),
+)
+
+
+def save(sim, path):
+    """Writes the state of sim to path, atomically."""
+    bodies = sim.bodies
+    n = len(bodies)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        header = HEADER.pack(MAGIC, n, bodies.next_id, sim.time, sim.G,
+                             sim.min_distance, sim.length)
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        for name, dtype, width in COLUMNS:
+            column = np.ascontiguousarray(getattr(bodies, name), dtype)
+            f.write(column.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def load(path, sim):
+    """
+    Restores the state saved in path into sim: the bodies, the time,
+    G, min_distance and length. The body arrays are copy-on-write maps
+    of the file. Checkpoints of the first version keep the
+    min_distance and length of sim.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    magic = header[:8]
+    if magic == MAGIC:
+        magic, n, next_id, time, G, min_distance, length = \
+            HEADER.unpack(header[:HEADER.size])
+    elif magic == MAGIC_1:
+        magic, n, next_id, time, G = HEADER_1.unpack(header[:HEADER_1.size])
+        min_distance, length = sim.min_distance, sim.length
+    else:
+        raise ValueError("%s is not a checkpoint" % path)
+
+    bodies = Bodies()
+    offset = HEADER_SIZE
+    for name, dtype, width in COLUMNS:
+        shape = (n, width) if width > 1 else (n,)
+        if n:
+            column = np.memmap(path, dtype, 'c', offset, shape)
+        else:
+            column = np.zeros(shape, dtype)
+        setattr(bodies, name, column)
+        offset += n*width*np.dtype(dtype).itemsize
+    bodies.is_fixed = bodies.is_fixed != 0
+    bodies.acc = np.zeros(n, complex)
+    bodies.next_id = next_id
+
+    sim.bodies = bodies
+    sim.time = time
+    sim.G = G
+    sim.min_distance = min_distance
+    sim.length = length
+    # The accelerations are computed again on the next step.
+    sim.acc_settings = None
+    return sim
+
+
+class Autosave():
+    def __init__(self, path, interval):
+        """Saves to path every interval of simulated time."""
+        self.path = path
+        self.interval = interval
+        self.last = None
+
+    def __call__(self, sim):
+        if self.last is None or sim.time >= self.last + self.interval:
+            save(sim, self.path)
+            self.last = sim.time
@@ -0,0 +1,160 @@
+"""
+Direct summation compiled with Numba, if it is installed.
+
+The kernel loops over the pairs in tiles of TILE x TILE bodies, the
+tiles of rows spread over all cores, and needs no memory beyond the
+results: no N x N arrays at all, so it runs at any N that fits. In the
+same pass it finds the bodies that overlap another one, which is all
+the collision check needs to know in most steps, and the potential of
+every body, for the diagnostics.
+
+Without Numba the same calls fall back to forces.direct and the
+spatial hash, with the same results. Check that both agree with
+
+    python compiled.py [n]
+"""
+
+import sys
+
+import numpy as np
+
+import forces
+from forces import G, MIN_DISTANCE
+import spatial_hash
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Bodies per side of a tile of pairs
+TILE = 64
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def kernel(x, y, mass, radius, G, min_distance, ax, ay, touching,
+               phi):
+        """
+        ax, ay, touching and phi of every body, from all others. The
+        rows of a tile are only written by the thread owning the tile.
+        """
+        n = len(x)
+        tiles = (n + TILE - 1) // TILE
+        for tile in numba.prange(tiles):
+            a = tile*TILE
+            b = min(a + TILE, n)
+            for i in range(a, b):
+                ax[i] = 0.0
+                ay[i] = 0.0
+                touching[i] = False
+                phi[i] = 0.0
+            for start in range(0, n, TILE):
+                end = min(start + TILE, n)
+                for i in range(a, b):
+                    sx = 0.0
+                    sy = 0.0
+                    sp = 0.0
+                    touch = False
+                    for j in range(start, end):
+                        if j == i:
+                            continue
+                        dx = x[j] - x[i]
+                        dy = y[j] - y[i]
+                        d = np.sqrt(dx*dx + dy*dy)
+                        inverse = 1.0/max(d, min_distance)
+                        sp += mass[j]*inverse
+                        if d > min_distance:
+                            s = mass[j]*inverse*inverse*inverse
+                            sx += s*dx
+                            sy += s*dy
+                        if d < radius[i] + radius[j]:
+                            touch = True
+                    ax[i] += G*sx
+                    ay[i] += G*sy
+                    phi[i] -= G*sp
+                    if touch:
+                        touching[i] = True
+
+
+def accelerations(pos, mass, G=G, min_distance=MIN_DISTANCE, radius=None,
+                  potential=False, compiled=True):
+    """
+    Same call as forces.direct. With radius, (acc, touching) is
+    returned, touching telling which bodies overlap another one. With
+    potential=True, (acc, phi) as from forces.direct, and with both,
+    (acc, touching, phi). compiled=False takes the fallback even with
+    Numba installed.
+    """
+    if numba is None or not compiled:
+        if potential:
+            acc, phi = forces.direct(pos, mass, G, min_distance,
+                                     potential=True)
+        else:
+            acc, phi = forces.direct(pos, mass, G, min_distance), None
+        touching = None
+        if radius is not None:
+            touching = np.zeros(len(pos), bool)
+            p1, p2 = spatial_hash.overlapping_pairs(pos, radius)
+            touching[p1] = touching[p2] = True
+        return results(acc, touching, phi)
+
+    n = len(pos)
+    x = np.ascontiguousarray(pos.real)
+    y = np.ascontiguousarray(pos.imag)
+    # No overlaps are found with zero radii.
+    r = np.zeros(n) if radius is None else \
+        np.ascontiguousarray(radius, float)
+    ax, ay = np.empty(n), np.empty(n)
+    touching = np.empty(n, bool)
+    phi = np.empty(n)
+    kernel(x, y, np.ascontiguousarray(mass, float), r, float(G),
+           float(min_distance), ax, ay, touching, phi)
+    return results(ax + 1j*ay, None if radius is None else touching,
+                   phi if potential else None)
+
+def results(acc, touching, phi):
+    """acc, followed by touching and phi unless they are None."""
+    result = (acc,)
+    if touching is not None:
+        result += (touching,)
+    if phi is not None:
+        result += (phi,)
+    return result[0] if len(result) == 1 else result
+
+
+def check(n=2000, seed=0):
+    """
+    Compares the compiled kernel with the fallback on n random bodies,
+    some of them overlapping. Returns the largest relative difference
+    of the accelerations. Without Numba there is nothing to compare,
+    and RuntimeError is raised.
+    """
+    if numba is None:
+        raise RuntimeError("Numba is not installed, there is no compiled "
+                           "kernel to check")
+    rng = np.random.RandomState(seed)
+    pos = rng.uniform(0, 800, n) + 1j*rng.uniform(0, 800, n)
+    mass = rng.uniform(1, 100, n)
+    radius = rng.uniform(1, 5, n)
+    acc, touching, phi = accelerations(pos, mass, radius=radius,
+                                       potential=True)
+    expected, expected_touching, expected_phi = accelerations(
+        pos, mass, radius=radius, potential=True, compiled=False)
+    error = np.abs(acc - expected).max()/np.abs(expected).max()
+    assert error < 1e-10, "accelerations differ by %g" % error
+    assert (touching == expected_touching).all(), "overlaps differ"
+    phi_error = np.abs(phi - expected_phi).max()/np.abs(expected_phi).max()
+    assert phi_error < 1e-10, "potentials differ by %g" % phi_error
+    return error
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    if numba is None:
+        sys.exit("Numba is not installed, only the fallback is available: "
+                 "nothing to check.")
+    print("Numba %s, %d threads"
+          % (numba.__version__, numba.get_num_threads()))
+    print("Largest relative difference at n = %d: %.2e" % (n, check(n)))
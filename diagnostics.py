@@ -0,0 +1,131 @@
+"""
+Conserved quantities of a set of bodies.
+
+With only gravity and no fixed bodies, the total energy, the linear
+and angular momentum are conserved and the centre of mass moves in a
+straight line, so their drift over a run measures the error of the
+integration. Collisions keep the momenta but lose energy, fixed bodies
+and the edge bounce keep neither.
+
+The potential energy needs all pairs. With the backends in
+forces.POTENTIAL, Simulation.potential() takes it from the last force
+evaluation whenever it can, so a Monitor costs only O(N) per step on
+top of the force pass. The other backends pay for potentials(), an
+O(N^2) pass, at every measurement.
+"""
+
+from collections import deque
+
+import numpy as np
+
+import forces
+
+
+def kinetic_energy(bodies):
+    return 0.5*np.sum(bodies.mass*np.abs(bodies.vel)**2)
+
+def potentials(bodies, G, min_distance=forces.MIN_DISTANCE):
+    """
+    The potential of every body, phi_i = -G*sum(m_j/d). Closer than
+    min_distance there is no force, so the potential stays at its
+    value at min_distance.
+    """
+    pos, mass = bodies.pos, bodies.mass
+    phi = np.zeros(len(pos))
+    for a in range(0, len(pos), forces.STRIP):
+        b = min(a + forces.STRIP, len(pos))
+        distance = np.abs(pos[np.newaxis, a:] - pos[a:b, np.newaxis])
+        distance = np.maximum(distance, min_distance)
+        # Each pair once, j > i
+        with np.errstate(divide='ignore'):
+            inverse = np.triu(1/distance, 1)
+        phi[a:b] -= inverse.dot(mass[a:])
+        phi[a:] -= mass[a:b].dot(inverse)
+    return G*phi
+
+def potential_energy(bodies, G, min_distance=forces.MIN_DISTANCE, phi=None):
+    """
+    Sum over all pairs of -G*m_i*m_j/d. phi, the potential of every
+    body, is computed if not given.
+    """
+    if phi is None:
+        phi = potentials(bodies, G, min_distance)
+    # Every pair is in the potential of both bodies.
+    return 0.5*bodies.mass.dot(phi)
+
+def energy(bodies, G):
+    return kinetic_energy(bodies) + potential_energy(bodies, G)
+
+def momentum(bodies):
+    """Total linear momentum, as a complex number."""
+    return np.sum(bodies.mass*bodies.vel)
+
+def angular_momentum(bodies, origin=0):
+    """Total angular momentum about origin, sum of m*(r x v)."""
+    r = bodies.pos - origin
+    return np.sum(bodies.mass*(r.conj()*bodies.vel).imag)
+
+def centre_of_mass(bodies):
+    """The centre of mass as a complex number, 0 without bodies."""
+    total = np.sum(bodies.mass)
+    if not total:
+        return 0j
+    return np.sum(bodies.mass*bodies.pos)/total
+
+
+# The quantities of a measurement, in order
+QUANTITIES = ('time', 'n', 'kinetic', 'potential', 'energy', 'momentum',
+              'angular_momentum', 'centre')
+
+def measure(sim):
+    """All conserved quantities of sim, as a dict."""
+    bodies = sim.bodies
+    kinetic = kinetic_energy(bodies)
+    potential = potential_energy(bodies, sim.G, phi=sim.potential())
+    return dict(time=sim.time, n=len(bodies), kinetic=kinetic,
+                potential=potential, energy=kinetic + potential,
+                momentum=momentum(bodies),
+                angular_momentum=angular_momentum(bodies),
+                centre=centre_of_mass(bodies))
+
+
+class Monitor():
+    def __init__(self, every=1, length=None):
+        """
+        Measures every every-th step, keeping the last length
+        measurements, or all of them.
+        """
+        self.every = every
+        self.steps = 0
+        self.rows = deque(maxlen=length)
+
+    def __call__(self, sim):
+        """Call after every step, e.g. as callback of Simulation.run."""
+        if self.steps % self.every == 0:
+            self.rows.append(measure(sim))
+        self.steps += 1
+
+    def last(self):
+        return self.rows[-1] if self.rows else None
+
+    def series(self):
+        """The measurements as one array per quantity."""
+        return dict((name, np.array([row[name] for row in self.rows]))
+                    for name in QUANTITIES)
+
+    def drift(self):
+        """
+        The relative change of the energy and the change of the linear
+        and angular momentum since the first kept measurement.
+        """
+        if not self.rows:
+            return 0.0, 0j, 0.0
+        first, last = self.rows[0], self.rows[-1]
+        energy = first['energy']
+        relative = (last['energy'] - energy)/abs(energy) if energy else 0.0
+        return (relative, last['momentum'] - first['momentum'],
+                last['angular_momentum'] - first['angular_momentum'])
+
+    def save(self, path):
+        """Writes the series to path as an .npz file."""
+        np.savez(path, **self.series())
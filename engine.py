@@ -0,0 +1,350 @@
+"""
+Headless n-body simulation engine.
+
+The engine holds the state of all bodies and advances it, without any
+window or clock. simulation.py is one front end driving it at 60 Hz,
+but it can just as well run as many steps as the CPU allows:
+
+    python engine.py [steps] [checkpoint]
+
+With a checkpoint file the run resumes from it if it exists, and
+saves to it every 1000 steps and at the end.
+"""
+
+import os
+import sys
+import time as timer
+from random import Random
+from math import pi
+
+import numpy as np
+
+from bodies import Bodies
+import checkpoint
+import diagnostics
+import forces
+import profiling
+import spatial_hash
+import timestep
+from integrators import INTEGRATORS
+
+
+class Simulation():
+    def __init__(self, width=800, height=800, G=forces.G, steps=100,
+                 force_backend='direct', integrator='verlet', seed=None):
+        """
+        Sets up an empty simulation inside a width x height box,
+        the box is only used by the edge bounce.
+        """
+        self.bodies = Bodies()
+        # Source of the random body colors
+        self.random = Random(seed)
+        self.width = width
+        self.height = height
+
+        # Universal constant of gravitation
+        self.G = G
+        # There is no gravity between bodies closer than this.
+        self.min_distance = forces.MIN_DISTANCE
+
+        # Number of steps per call to advance()
+        self.steps = steps
+        self.exists_gravity = True
+        self.exists_collision = True
+        self.exists_edge_bounce = False
+
+        # Adaptive block timesteps, see timestep.py. When enabled, each
+        # step is split into up to 2^max_level substeps per body and the
+        # integrator is block leapfrog.
+        self.exists_adaptive = False
+        self.eta = 0.02
+        self.length = forces.MIN_DISTANCE
+        self.max_level = 8
+        # The finest level each body used in the last step
+        self.levels = np.zeros(0, np.int64)
+
+        self.time = 0
+        self.set_force(force_backend)
+        self.set_integrator(integrator)
+
+        # The settings bodies.acc was computed with, None if it
+        # has to be computed again before the next step.
+        self.acc_settings = None
+
+        # Whether the force passes also compute the potentials, for the
+        # diagnostics. phi is the potential of every body from the last
+        # pass of the last step, None if not known.
+        self.exists_diagnostics = False
+        self.phi = None
+        # Which bodies overlap another one at the last force pass, from
+        # backends that find them on the way, None if not known.
+        self.touching = None
+
+        # profiling.Timers for the force passes and collisions, if any
+        self.timers = None
+
+    def set_force(self, name, **options):
+        """Selects the force backend, see forces.BACKENDS."""
+        self.force_backend = name
+        self.force = forces.backend(name, **options)
+
+    def set_integrator(self, name):
+        """Selects the integrator, see integrators.INTEGRATORS."""
+        self.integrator_name = name
+        self.integrator = INTEGRATORS[name]
+
+    def accel(self, pos):
+        """The acceleration of every body if placed at pos."""
+        if not self.exists_gravity:
+            return np.zeros(len(pos), complex)
+        contacts = self.exists_collision and \
+            self.force_backend in forces.CONTACTS
+        potential = self.exists_diagnostics and \
+            self.force_backend in forces.POTENTIAL
+        mass = self.bodies.mass
+        with self.timer('force'):
+            if contacts and potential:
+                acc, self.touching, self.phi = self.force(
+                    pos, mass, self.G, self.min_distance,
+                    radius=self.bodies.radius, potential=True)
+                return acc
+            if contacts:
+                acc, self.touching = self.force(
+                    pos, mass, self.G, self.min_distance,
+                    radius=self.bodies.radius)
+                return acc
+            if potential:
+                acc, self.phi = self.force(pos, mass, self.G,
+                                           self.min_distance, potential=True)
+                return acc
+            return self.force(pos, mass, self.G, self.min_distance)
+
+    def timer(self, name):
+        """Times a phase if self.timers is set, see profiling.py."""
+        if self.timers is None:
+            return profiling.no_timer
+        return self.timers(name)
+
+    def potential(self):
+        """
+        The potential of every body at its current position. The one
+        from the last force pass is used while it is valid, otherwise
+        the accelerations are computed again along with it.
+        """
+        bodies = self.bodies
+        settings = (self.exists_gravity, self.G, self.min_distance,
+                    self.force)
+        if not self.exists_gravity:
+            return np.zeros(len(bodies))
+        if self.acc_settings == settings and self.phi is not None:
+            return self.phi
+        if self.force_backend in forces.POTENTIAL:
+            with self.timer('force'):
+                bodies.acc, self.phi = self.force(
+                    bodies.pos, bodies.mass, self.G, self.min_distance,
+                    potential=True)
+            self.acc_settings = settings
+            return self.phi
+        return diagnostics.potentials(bodies, self.G, self.min_distance)
+
+    def add(self, pos, vel=0, radius=20, mass=None, color=None,
+            is_fixed=False):
+        """
+        Adds a body and returns its id, or several if pos is an array,
+        see Bodies.append. The color defaults to random.
+        """
+        if color is None:
+            color = [[self.random.uniform(.5, 1) for i in range(3)]
+                     for j in range(np.size(pos))]
+        self.acc_settings = None
+        return self.bodies.append(pos, vel, radius, mass, color, is_fixed)
+
+    def clear(self):
+        """Removes all bodies."""
+        self.bodies.remove(slice(None))
+        self.acc_settings = self.phi = self.touching = None
+
+    def step(self, dt):
+        """
+        One step of length dt, in two phases: the accelerations of all
+        bodies are computed from the same positions, then all bodies
+        are advanced together. The order of the bodies never matters.
+        """
+        bodies = self.bodies
+        settings = (self.exists_gravity, self.G, self.min_distance,
+                    self.force)
+        self.phi = self.touching = None
+        if self.acc_settings != settings:
+            bodies.acc = self.accel(bodies.pos)
+        if self.exists_adaptive:
+            self.levels = timestep.block_step(self, dt)
+            # Only some accelerations were computed at the end.
+            self.phi = self.touching = None
+        else:
+            # The last force pass is at the new positions.
+            self.integrator(bodies, dt, self.accel)
+        self.acc_settings = settings
+        # Merged or pushed back bodies change the accelerations.
+        if self.exists_collision:
+            with self.timer('collision'):
+                if body_collision(bodies, self.touching):
+                    self.acc_settings = None
+        if self.exists_edge_bounce:
+            with self.timer('edge bounce'):
+                if edge_bounce(bodies, self.width, self.height):
+                    self.acc_settings = None
+        self.time += dt
+
+    def advance(self, dt, callback=None):
+        """
+        Advances the time dt, split evenly over self.steps steps.
+        callback(self) is called after every step if given.
+        """
+        steps = int(self.steps)
+        self.run(steps, float(dt) / steps, callback)
+
+    def run(self, n, dt, callback=None):
+        """
+        Takes n steps of length dt, as fast as possible.
+        callback(self) is called after every step if given.
+        """
+        for count in range(n):
+            self.step(dt)
+            if callback is not None:
+                callback(self)
+
+
+################################################################
+#       Physics
+################################################################
+# This set of functions operates on Bodies,
+# with pos and vel represented as complex arrays.
+
+
+def body_collision(bodies, candidates=None):
+    """
+    Perfectly inelastic collisions between all overlapping bodies.
+    The larger body will consume the smaller.
+    Momentum is conserved. Returns the number of consumed bodies.
+
+    The overlapping pairs come from the spatial hash broad phase.
+    They are collected in a merge list and applied once: every group
+    of touching bodies is fused into its most massive member.
+    If candidates is given, a boolean array, only those bodies can
+    overlap, as found by the force pass.
+    """
+    if candidates is None:
+        p1, p2 = spatial_hash.overlapping_pairs(bodies.pos, bodies.radius)
+    else:
+        index = np.flatnonzero(candidates)
+        if len(index) < 2:
+            return 0
+        p1, p2 = spatial_hash.overlapping_pairs(bodies.pos[index],
+                                                bodies.radius[index])
+        p1, p2 = index[p1], index[p2]
+    if not len(p1):
+        return 0
+    consumed = merge(bodies.mass, bodies.vel, bodies.radius, p1, p2)
+    # The consumed planets are removed
+    bodies.remove(consumed)
+    return len(consumed)
+
+def merge(mass, vel, radius, p1, p2):
+    """
+    Fuses every group of bodies joined by the pairs (p1, p2) into its
+    most massive member, changing mass, vel and radius in place.
+    Returns the indices of the consumed bodies.
+    """
+    # Label every body with the lowest index of its group.
+    group = np.arange(len(mass))
+    while True:
+        low = np.minimum(group[p1], group[p2])
+        new = group.copy()
+        np.minimum.at(new, p1, low)
+        np.minimum.at(new, p2, low)
+        new = new[new]
+        if (new == group).all():
+            break
+        group = new
+
+    involved = np.unique(np.r_[p1, p2])
+    m, v = mass[involved], vel[involved]
+    labels, merged = np.unique(group[involved], return_inverse=True)
+
+    # Always let the larger body consume the smaller.
+    # The later one is the big one if the masses are equal.
+    order = np.lexsort((involved, m, merged))
+    last = np.r_[np.flatnonzero(np.diff(merged[order])), len(order) - 1]
+    big = involved[order[last]]
+
+    # Fuse masses.
+    total = np.bincount(merged, m)
+    # Momentum: m1*v1 + m2*v2 = (m1+m2)*v_total
+    momentum = np.bincount(merged, (m*v).real) + \
+               np.bincount(merged, (m*v).imag)*1j
+    mass[big] = total
+    vel[big] = momentum / total
+    # Change radius to reflect the new mass.
+    # 1 mass unit = 1 pixel => mass = area => radius = sqrt(mass/pi)
+    radius[big] = np.sqrt(total/pi)
+    return np.setdiff1d(involved, big)
+
+def edge_bounce(bodies, width, height, elasticity=1):
+    """
+    Bounce of the edges of the width x height box.
+    Adjusting vel so that: incidence angle = departure angle
+    Takes collission elasticity into account.
+    Pushes back bodies that are located (partially or fully)
+    outside the edges. Fixed bodies are left alone.
+    Returns the number of bounced bodies.
+    """
+    x, y, r = bodies.pos.real, bodies.pos.imag, bodies.radius
+    free = ~bodies.is_fixed
+    # Only one edge is handled per call, in this order.
+    left = free & (x - r < 0)
+    right = free & ~left & (x + r > width)
+    bottom = free & ~left & ~right & (y - r < 0)
+    top = free & ~left & ~right & ~bottom & (y + r > height)
+    # Mirroring the angle: pi - arg for the side edges,
+    # 2*pi - arg for the bottom and top edges.
+    side = left | right
+    bodies.vel[side] = -bodies.vel[side].conj()*elasticity
+    vertical = bottom | top
+    bodies.vel[vertical] = bodies.vel[vertical].conj()*elasticity
+    bodies.pos[left] += r[left] - x[left]
+    bodies.pos[right] += width - (x[right] + r[right])
+    bodies.pos[bottom] += (r[bottom] - y[bottom])*1j
+    bodies.pos[top] += (height - (y[top] + r[top]))*1j
+    return np.count_nonzero(side | vertical)
+
+
+################################################################
+#       Scenes
+################################################################
+
+
+def start(sim):
+    """Two bodies orbiting each other around the centre of the box."""
+    centre = sim.width/2. + sim.height/2.*1j
+    sim.add(centre - 100j, vel=100, radius=20)
+    sim.add(centre + 100j, vel=-100, radius=20)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    path = sys.argv[2] if len(sys.argv) > 2 else None
+    dt = 1/6000.
+    sim = Simulation()
+    if path and os.path.exists(path):
+        checkpoint.load(path, sim)
+        print("Resumed at time %g" % sim.time)
+    else:
+        start(sim)
+    autosave = checkpoint.Autosave(path, 1000*dt) if path else None
+    t = timer.time()
+    sim.run(n, dt, autosave)
+    t = timer.time() - t
+    if path:
+        checkpoint.save(sim, path)
+    print("%d steps in %.3f s, %.0f steps/s" % (n, t, n/t))
+    print("Active planets: %d" % len(sim.bodies))
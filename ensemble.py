@@ -0,0 +1,187 @@
+"""
+Parameter sweeps: many independent headless runs over a process pool.
+
+Every combination of the swept parameters and seeds is one member of
+the ensemble. The members run in parallel and the summary of each one
+is appended to the results file as a JSON line as soon as it is done:
+    the parameters, bodies at start, survivors, mergers,
+    energy drift, simulated time and runtime
+An interrupted sweep is resumed by running the same command again,
+members already in the results file are not run again.
+
+    python ensemble.py --scene cold_collapse --n 100 --G 1e3 2.8e3
+        --steps 10 100 --collision on off --seeds 50 --output sweep.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time as timer
+
+import diagnostics
+import engine
+import forces
+from integrators import INTEGRATORS
+from scenes import SCENES
+
+
+# The parameters of a member, the rest of a result is its summary.
+MEMBER = ('scene', 'n', 'G', 'steps', 'collision', 'edge_bounce', 'seed',
+          'frames', 'dt', 'integrator', 'force_backend')
+
+# The members already run in worker processes, which cannot start the
+# workers of the pool backend of their own.
+BACKENDS = sorted(set(forces.BACKENDS) - set(['pool']))
+
+
+def key(member):
+    """The parameters of a member as one string, to tell runs apart."""
+    return json.dumps(member, sort_keys=True)
+
+def members(scene, n, G, steps, collision, edge_bounce, seeds, frames, dt,
+            integrator='verlet', force_backend='direct'):
+    """
+    Every combination of the lists G, steps, collision and edge_bounce,
+    for the seeds 0 .. seeds-1, as parameter dicts.
+    """
+    for g, s, c, e, seed in itertools.product(G, steps, collision,
+                                              edge_bounce, range(seeds)):
+        yield dict(scene=scene, n=n, G=g, steps=s, collision=c,
+                   edge_bounce=e, seed=seed, frames=frames, dt=dt,
+                   integrator=integrator, force_backend=force_backend)
+
+def run(member):
+    """Runs one member and returns its parameters with the summary."""
+    sim = engine.Simulation(G=member['G'], steps=member['steps'],
+                            integrator=member['integrator'],
+                            force_backend=member['force_backend'],
+                            seed=member['seed'])
+    sim.exists_collision = member['collision']
+    sim.exists_edge_bounce = member['edge_bounce']
+    SCENES[member['scene']][0](sim, member['n'], member['seed'])
+
+    def energy():
+        return diagnostics.kinetic_energy(sim.bodies) + \
+               diagnostics.potential_energy(sim.bodies, sim.G,
+                                            sim.min_distance)
+    start = len(sim.bodies)
+    before = energy()
+    t = timer.time()
+    for frame in range(member['frames']):
+        sim.advance(member['dt'])
+    t = timer.time() - t
+    after = energy()
+
+    result = dict(member)
+    result.update(bodies=start, survivors=len(sim.bodies),
+                  mergers=start - len(sim.bodies),
+                  energy_drift=(after - before)/abs(before) if before else 0.0,
+                  time=sim.time, runtime=t)
+    return result
+
+def finished(path):
+    """The keys of the members already in the results file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by the interruption
+                continue
+            done.add(key(dict((name, result[name]) for name in MEMBER)))
+    return done
+
+
+def sweep(todo, path, processes=None, callback=None):
+    """
+    Runs the members of todo that are not in the results file path,
+    appending each result as it comes. callback(result) is called for
+    every result if given. Returns the number of members run. A member
+    with an unknown integrator or a backend not in BACKENDS raises
+    ValueError before anything runs.
+    """
+    for member in todo:
+        if member['force_backend'] not in BACKENDS:
+            raise ValueError("force backend %r cannot run in an ensemble, "
+                             "choose from %s" % (member['force_backend'],
+                                                 ', '.join(BACKENDS)))
+        if member['integrator'] not in INTEGRATORS:
+            raise ValueError("unknown integrator %r" % member['integrator'])
+    done = finished(path)
+    todo = [member for member in todo if key(member) not in done]
+    if not todo:
+        return 0
+    # A line cut short by an interruption is closed, the next one
+    # starts on its own line.
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            cut = f.read(1) != b'\n'
+        if cut:
+            with open(path, 'a') as f:
+                f.write('\n')
+    pool = multiprocessing.Pool(processes)
+    try:
+        with open(path, 'a') as f:
+            for result in pool.imap_unordered(run, todo):
+                f.write(json.dumps(result) + '\n')
+                f.flush()
+                if callback is not None:
+                    callback(result)
+    finally:
+        pool.terminate()
+        pool.join()
+    return len(todo)
+
+
+def switch(text):
+    return {'on': True, 'off': False}[text]
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scene', default='cold_collapse',
+                        choices=sorted(SCENES))
+    parser.add_argument('--n', type=int, default=100)
+    parser.add_argument('--G', nargs='+', type=float, default=[2.8e3])
+    parser.add_argument('--steps', nargs='+', type=int, default=[100])
+    parser.add_argument('--collision', nargs='+', type=switch,
+                        default=[True], metavar='on|off')
+    parser.add_argument('--edge-bounce', nargs='+', type=switch,
+                        default=[False], metavar='on|off')
+    parser.add_argument('--seeds', type=int, default=10,
+                        help="runs per combination, seeded 0, 1, ...")
+    parser.add_argument('--frames', type=int, default=60,
+                        help="calls to advance(dt) per run")
+    parser.add_argument('--dt', type=float, default=1/60.)
+    parser.add_argument('--integrator', default='verlet',
+                        choices=sorted(INTEGRATORS))
+    parser.add_argument('--backend', default='direct', choices=BACKENDS)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args(argv)
+
+    todo = list(members(args.scene, args.n, args.G, args.steps,
+                        args.collision, args.edge_bounce, args.seeds,
+                        args.frames, args.dt, args.integrator, args.backend))
+    count = [0]
+    def progress(result):
+        count[0] += 1
+        print("%d  G=%g steps=%d collision=%s edge bounce=%s seed=%d: "
+              "%d survivors, %d mergers, energy drift %.2e, %.2f s"
+              % (count[0], result['G'], result['steps'], result['collision'],
+                 result['edge_bounce'], result['seed'], result['survivors'],
+                 result['mergers'], result['energy_drift'],
+                 result['runtime']))
+        sys.stdout.flush()
+    ran = sweep(todo, args.output, args.processes, progress)
+    print("%d members run, %d were done already" % (ran, len(todo) - ran))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
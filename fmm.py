@@ -0,0 +1,396 @@
+"""
+Fast multipole method, O(N) per evaluation at a set accuracy.
+
+The force is the 1/d^2 of forces.direct, from the potential
+phi(z) = -G*sum(m_j/|z - z_j|). With complex positions,
+    1/|z - w| = 1/|z| * (1 - w/z)^(-1/2) * (1 - conj(w)/conj(z))^(-1/2)
+and both factors are power series, so the bodies of a box are
+summed up by the complex moments
+    M_kl = sum(m * s^k * conj(s)^l),  k + l <= order
+of their offsets s from the centre of the box, and the potential
+near the centre of another box by a local expansion
+    phi(u) = sum(L_kl * u^k * conj(u)^l)
+in the offset u from that centre. The acceleration is
+2*G*dphi/dconj(u).
+
+The tree is an adaptive quadtree: boxes with more than leaf_size
+bodies are split, so a dense core is refined as deep as it needs and
+the space around it is not. Moments are moved up the tree (M2M),
+turned into local expansions between boxes of the same level that
+are not neighbours but whose parents are (M2L), and moved down the
+tree to the leaves (L2L). Neighbouring boxes of which one is a leaf
+are summed directly, with the same rule as forces.direct, in chunks
+of bounded size. All offsets are in units of the side of the box, so
+every level uses the same translation matrices, and the M2L of all
+pairs of boxes at the same relative position is one matrix product.
+
+M2M and L2L are exact, the only error is cutting the M2L series at
+order. The offset between a body and a target in two well separated
+boxes is at most q = 1/sqrt(2) of the distance between their centres,
+which bounds the relative error of every far interaction by
+    (1 + q)/(1 - q) * q^(order + 1)
+see bound(). Run this file to compare with the direct sum.
+"""
+
+import sys
+import time as timer
+
+import numpy as np
+
+import forces
+from forces import G, MIN_DISTANCE
+from barnes_hut import interleave, ranks
+
+
+# Highest power of the expansions, larger is slower and more accurate.
+ORDER = 16
+# Boxes with more bodies than this are split.
+LEAF_SIZE = 32
+# Deepest level of the tree, the root side is split in 2^DEPTH cells.
+DEPTH = 16
+# Size of the work arrays: direct pairs, or bodies times coefficients
+# of the expansions, handled at once.
+CHUNK = 2**16
+
+# Ratio of offset to distance between centres of well separated boxes
+Q = 2**-0.5
+
+# The 40 positions of a box in the interaction list of another, and
+# the 9 of its neighbours, itself included.
+FAR = [(dx, dy) for dx in range(-3, 4) for dy in range(-3, 4)
+       if max(abs(dx), abs(dy)) >= 2]
+NEAR = [(dx, dy) for dx in range(-1, 2) for dy in range(-1, 2)]
+
+
+def bound(order=ORDER):
+    """
+    Upper bound of the relative error of the potential of one body
+    at one target in well separated boxes.
+    """
+    return (1 + Q)/(1 - Q)*Q**(order + 1)
+
+
+class Operators():
+    def __init__(self, order):
+        """
+        The translation matrices of the expansions of order, acting
+        on rows of the K = (order + 1)*(order + 2)/2 coefficients
+        (k, l), k + l <= order:
+          m2m[q], l2l[q] between a box and its child in quadrant q,
+          m2l[dx, dy] from a box to the one dx, dy boxes away.
+        """
+        p = order
+        self.order = p
+        self.k, self.l = np.array([(k, l) for k in range(p + 1)
+                                   for l in range(p + 1 - k)]).T
+        # Binomial coefficients, and those of (1 - x)^(-1/2)
+        C = np.zeros((p + 1, p + 1))
+        C[:, 0] = 1
+        for n in range(1, p + 1):
+            C[n, 1:] = C[n - 1, 1:] + C[n - 1, :-1]
+        c = np.cumprod(np.r_[1.0, (2*np.arange(1, p + 1) - 1.0) /
+                                  (2*np.arange(1, p + 1))])
+        self.C, self.c = C, c
+
+        quadrants = [(qx, qy) for qx in range(2) for qy in range(2)]
+        self.m2m, self.l2l = {}, {}
+        for qx, qy in quadrants:
+            # The centre of the child from the centre of the parent
+            d = complex(2*qx - 1, 2*qy - 1)/4
+            self.m2m[qx, qy] = self.shift(d, self.k, self.l)
+            self.l2l[qx, qy] = self.shift(d, self.k, self.l).T
+        # From the source box to the target, the target sees the
+        # source at -(dx, dy).
+        self.m2l = dict(((dx, dy), self.translate(complex(-dx, -dy)))
+                        for dx, dy in FAR)
+
+    def shift(self, d, k, l):
+        """
+        [(a, b), (k, l)]: C(k, a)*C(l, b)*d^(k - a)*conj(d)^(l - b)/2^(a + b),
+        moments about a child centre to moments about the parent, or
+        transposed, a local expansion about the parent to its child.
+        """
+        a, b = k[:, np.newaxis], l[:, np.newaxis]
+        k, l = k[np.newaxis], l[np.newaxis]
+        C = self.C
+        return C[k, a]*C[l, b] * d**np.maximum(k - a, 0) * \
+               np.conj(d)**np.maximum(l - b, 0) / 2.0**(a + b)
+
+    def translate(self, r):
+        """
+        [(i, j), (k, l)], moments about the source centre to a local
+        expansion about the target centre, the target at r from the
+        source, in units of the side:
+          L_kl = (-1)^(k + l)/|r| * sum(c_a*c_b*C(a, k)*C(b, l)
+                                        * r^-a * conj(r)^-b * M_ij)
+        with a = i + k, b = j + l, a + b <= order.
+        """
+        i, j = self.k[:, np.newaxis], self.l[:, np.newaxis]
+        k, l = self.k[np.newaxis], self.l[np.newaxis]
+        a, b = i + k, j + l
+        kept = a + b <= self.order
+        a, b = np.where(kept, a, 0), np.where(kept, b, 0)
+        return np.where(kept, (-1.0)**(k + l) * self.c[a]*self.c[b] *
+                        self.C[a, k]*self.C[b, l] * r**-a.astype(float) *
+                        np.conj(r)**-b.astype(float), 0) / abs(r)
+
+operators = {}
+
+def get_operators(order):
+    if order not in operators:
+        operators[order] = Operators(order)
+    return operators[order]
+
+
+def powers(u, p):
+    """[u^0, u^1, .., u^p] of every u, as columns"""
+    return u[:, np.newaxis]**np.arange(p + 1)
+
+
+class Tree():
+    def __init__(self, pos, leaf_size=LEAF_SIZE, min_distance=MIN_DISTANCE):
+        """
+        Sorts the bodies along a Morton curve and splits every box with
+        more than leaf_size bodies, down to the deepest level whose
+        boxes are still wider than min_distance. For every level, the
+        boxes holding bodies, in Morton order:
+          key, x, y, start and count (the range of sorted bodies inside
+          the box), parent (index into the level above) and leaf.
+        """
+        n = len(pos)
+        # The root is the smallest square enclosing all bodies.
+        self.origin = complex(pos.real.min(), pos.imag.min())
+        side = max(pos.real.max() - self.origin.real,
+                   pos.imag.max() - self.origin.imag)
+        self.side = side*(1 + 1e-9) or 1.0
+        # Far pairs are at least a box apart, and must feel the force.
+        depth = DEPTH
+        while depth and self.side/2**depth <= min_distance:
+            depth -= 1
+        cells = 2**DEPTH
+        ix = np.minimum(((pos.real - self.origin.real)/self.side*cells)
+                        .astype(np.int64), cells - 1)
+        iy = np.minimum(((pos.imag - self.origin.imag)/self.side*cells)
+                        .astype(np.int64), cells - 1)
+        code = interleave(ix) | (interleave(iy) << 1)
+        self.order = np.argsort(code, kind='stable')
+        code, ix, iy = code[self.order], ix[self.order], iy[self.order]
+
+        zero = np.zeros(1, np.int64)
+        self.key, self.x, self.y = [zero], [zero], [zero]
+        self.start, self.count, self.parent = [zero], [np.array([n])], [zero]
+        self.leaf = []
+        active = np.arange(n)  # sorted bodies inside the current level
+        for level in range(1, depth + 1):
+            opened = self.count[-1] > leaf_size
+            self.leaf.append(~opened)
+            if not opened.any():
+                break
+            # Only bodies of opened boxes are split further.
+            active = active[np.repeat(opened, self.count[-1])]
+            key = code[active] >> 2*(DEPTH - level)
+            first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+            start = active[first]
+            self.parent.append(np.searchsorted(self.key[-1], key[first] >> 2))
+            self.key.append(key[first])
+            self.x.append(ix[start] >> (DEPTH - level))
+            self.y.append(iy[start] >> (DEPTH - level))
+            self.start.append(start)
+            self.count.append(np.diff(np.r_[first, len(active)]))
+        if len(self.leaf) < len(self.key):
+            self.leaf.append(np.ones(len(self.key[-1]), bool))
+        self.depth = len(self.key) - 1
+
+    def width(self, level):
+        return self.side/2**level
+
+    def centres(self, level):
+        width = self.width(level)
+        return self.origin + (self.x[level] + 0.5)*width + \
+               1j*(self.y[level] + 0.5)*width
+
+    def bodies(self, level, boxes):
+        """The sorted bodies inside boxes, and the box of each."""
+        count = self.count[level][boxes]
+        inside = np.repeat(self.start[level][boxes], count) + ranks(count)
+        return inside, np.repeat(boxes, count)
+
+    def pairs(self, level, offsets):
+        """For every offset, the boxes (target, source) it links."""
+        size = 2**level
+        x, y, key = self.x[level], self.y[level], self.key[level]
+        for dx, dy in offsets:
+            sx, sy = x + dx, y + dy
+            ok = (sx >= 0) & (sx < size) & (sy >= 0) & (sy < size)
+            # Boxes of the interaction list have neighbouring parents.
+            ok &= (np.abs((sx >> 1) - (x >> 1)) <= 1) & \
+                  (np.abs((sy >> 1) - (y >> 1)) <= 1)
+            source = interleave(sx) | (interleave(sy) << 1)
+            found = np.minimum(np.searchsorted(key, source), len(key) - 1)
+            ok &= key[found] == source
+            yield (dx, dy), np.flatnonzero(ok), found[ok]
+
+
+def direct_pairs(pos, mass, G, min_distance, target, source, acc):
+    """
+    Adds to acc the pull of the bodies of the source ranges on those of
+    the target ranges, each a (start, count) pair of arrays, with the
+    rule of forces.direct. Large ranges are split into rows of targets
+    so that at most about CHUNK pairs are formed at once.
+    """
+    n = len(acc)
+    (t_start, t_count), (s_start, s_count) = target, source
+    rows = np.maximum(CHUNK // np.maximum(s_count, 1), 1)
+    pieces = -(-t_count // rows)
+    piece = np.repeat(np.arange(len(t_start)), pieces)
+    first = ranks(pieces)*rows[piece]
+    t_start = t_start[piece] + first
+    t_count = np.minimum(rows[piece], t_count[piece] - first)
+    s_start, s_count = s_start[piece], s_count[piece]
+
+    sizes = t_count*s_count
+    ends = np.cumsum(sizes)
+    a = 0
+    while a < len(sizes):
+        b = max(np.searchsorted(ends, ends[a] - sizes[a] + CHUNK, 'right'),
+                a + 1)
+        counts = sizes[a:b]
+        link = np.repeat(np.arange(a, b), counts)
+        rank = ranks(counts)
+        i = t_start[link] + rank // s_count[link]
+        j = s_start[link] + rank % s_count[link]
+        diff = pos[j] - pos[i]
+        distance = np.abs(diff)
+        near = distance <= min_distance
+        distance[near] = 1
+        pull = mass[j]/distance**3*diff
+        pull[near] = 0
+        acc += G*(np.bincount(i, pull.real, n) +
+                  1j*np.bincount(i, pull.imag, n))
+        a = b
+
+
+def accelerations(pos, mass, G=G, min_distance=MIN_DISTANCE, order=ORDER,
+                  leaf_size=LEAF_SIZE):
+    """
+    Fast multipole force backend, same call as forces.direct.
+    Falls back to forces.direct when the tree would have less than
+    three levels.
+    """
+    n = len(pos)
+    if not n:
+        return np.zeros(0, complex)
+    tree = Tree(pos, leaf_size, min_distance)
+    if tree.depth < 2:
+        return forces.direct(pos, mass, G, min_distance)
+    ops = get_operators(order)
+    K = len(ops.k)
+    pos, mass = pos[tree.order], mass[tree.order]
+    step = max(CHUNK // K, 1)
+
+    # Moments of every box from level 2 down, in units of its side:
+    # P2M for the leaves, M2M from the children for the others.
+    moments = {}
+    for level in range(tree.depth, 1, -1):
+        M = np.zeros((len(tree.key[level]), K), complex)
+        inside, box = tree.bodies(level, np.flatnonzero(tree.leaf[level]))
+        u = (pos[inside] - tree.centres(level)[box])/tree.width(level)
+        for a in range(0, len(inside), step):
+            b = min(a + step, len(inside))
+            U = powers(u[a:b], order)
+            terms = mass[inside[a:b], np.newaxis] * \
+                    U[:, ops.k]*np.conj(U[:, ops.l])
+            runs = np.flatnonzero(np.r_[True, box[a + 1:b] != box[a:b - 1]])
+            M[box[a + runs]] += np.add.reduceat(terms, runs)
+        if level < tree.depth:
+            # Every box has at most one child in each quadrant.
+            x, y = tree.x[level + 1], tree.y[level + 1]
+            for q, T in ops.m2m.items():
+                child = np.flatnonzero((x & 1 == q[0]) & (y & 1 == q[1]))
+                M[tree.parent[level + 1][child]] += \
+                    moments[level + 1][child].dot(T)
+        moments[level] = M
+
+    # M2L and L2L from level 2 down, and L2P at the leaves of each level:
+    # a = 2*G*dphi/dconj(u), with u in units of the side of the leaf.
+    acc = np.zeros(n, complex)
+    has_l = ops.l > 0
+    k, l = ops.k[has_l], ops.l[has_l]
+    local = None
+    for level in range(2, tree.depth + 1):
+        L = np.zeros((len(tree.key[level]), K), complex)
+        if local is not None:
+            x, y = tree.x[level], tree.y[level]
+            for q, T in ops.l2l.items():
+                child = np.flatnonzero((x & 1 == q[0]) & (y & 1 == q[1]))
+                L[child] = local[tree.parent[level][child]].dot(T)
+        width = tree.width(level)
+        for offset, target, source in tree.pairs(level, FAR):
+            L[target] += moments[level][source].dot(ops.m2l[offset])/width
+        local = L
+
+        inside, box = tree.bodies(level, np.flatnonzero(tree.leaf[level]))
+        u = (pos[inside] - tree.centres(level)[box])/width
+        for a in range(0, len(inside), step):
+            b = min(a + step, len(inside))
+            U = powers(u[a:b], order)
+            terms = l*local[box[a:b]][:, has_l]*U[:, k]*np.conj(U[:, l - 1])
+            acc[inside[a:b]] = 2*G/width*terms.sum(axis=1)
+
+    # Neighbouring boxes of which one is a leaf, directly: all pairs
+    # between the bodies of the leaf and those of the other box.
+    target, source = [], []
+    for level in range(1, tree.depth + 1):
+        leaf = tree.leaf[level]
+        for offset, t, s in tree.pairs(level, NEAR):
+            near = leaf[t] | leaf[s]
+            t, s = t[near], s[near]
+            target.append((tree.start[level][t], tree.count[level][t]))
+            source.append((tree.start[level][s], tree.count[level][s]))
+    direct_pairs(pos, mass, G, min_distance,
+                 [np.concatenate(column) for column in zip(*target)],
+                 [np.concatenate(column) for column in zip(*source)], acc)
+
+    result = np.empty(n, complex)
+    result[tree.order] = acc
+    return result
+
+
+def accuracy_report(n=20000, orders=(4, 8, 12, 16), sample=1000, seed=0):
+    """
+    Prints the error of the fast multipole accelerations relative to
+    the direct sum for n bodies spread uniformly on a disk, with the
+    bound of the error of each far interaction. The direct sum is only
+    computed for a sample of the bodies.
+    """
+    rng = np.random.RandomState(seed)
+    r = 350*np.sqrt(rng.uniform(0, 1, n))
+    pos = 400+400j + r*np.exp(2j*np.pi*rng.uniform(0, 1, n))
+    mass = rng.uniform(2, 5, n)**2*np.pi
+    targets = rng.choice(n, min(sample, n), replace=False)
+
+    t = timer.time()
+    exact = forces.direct(pos, mass, targets=targets)
+    t_direct = (timer.time() - t) * n/len(targets)
+
+    print("Fast multipole vs direct sum, %d bodies" % n)
+    print("direct sum: %.3f s (estimated)" % t_direct)
+    print("Relative error per body, and of all bodies (rms)")
+    print("%6s %10s %10s %10s %10s %10s %10s %8s"
+          % ('order', 'median', '99%', 'max', 'rms', 'bound', 'time [s]',
+             'speedup'))
+    for order in orders:
+        get_operators(order)
+        t = timer.time()
+        approx = accelerations(pos, mass, order=order)
+        t_fmm = timer.time() - t
+        error = np.abs(approx[targets] - exact)
+        rms = np.sqrt(np.mean(error**2) / np.mean(np.abs(exact)**2))
+        error /= np.abs(exact)
+        print("%6d %10.2e %10.2e %10.2e %10.2e %10.2e %10.3f %8.1f"
+              % (order, np.median(error), np.percentile(error, 99),
+                 error.max(), rms, bound(order), t_fmm, t_direct/t_fmm))
+
+
+if __name__ == '__main__':
+    accuracy_report(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,232 @@
+"""
+Gravitational acceleration kernels.
+
+Each kernel takes the positions (complex array) and masses of all
+bodies and returns the acceleration of every body as a complex array.
+"""
+
+import importlib
+from functools import partial
+
+import numpy as np
+
+
+# Universal constant of gravitation, in pixel units
+G = 2.8e3
+
+# There is no gravity if bodies are closer than this.
+# Normally this never happens, collision will already have happened.
+MIN_DISTANCE = 10
+
+
+# Rows of the pair matrix handled at once by direct()
+STRIP = 256
+
+
+def direct(pos, mass, G=G, min_distance=MIN_DISTANCE, targets=None,
+           potential=False):
+    """
+    Direct summation over all pairs.
+    For every body i and every other body j:
+      F = G*m_i*m_j/d^2
+     a_i = F/m_i = G*m_j/d^2, directed towards j.
+    By Newton's third law j is pulled back towards i by G*m_i/d^2,
+    so each pair is evaluated once, for j > i, a strip of rows at a
+    time. Only the accelerations of pos[targets] are computed if given.
+
+    With potential=True the potential of every body,
+      phi_i = -G*sum(m_j/d), d no less than min_distance,
+    is returned as well, (acc, phi), from the same distances.
+    """
+    if targets is not None:
+        return one_sided(pos, mass, G, min_distance, targets)
+    n = len(pos)
+    acc = np.zeros(n, complex)
+    phi = np.zeros(n) if potential else None
+    for a in range(0, n, STRIP):
+        b = min(a + STRIP, n)
+        # diff[i, j] = pos[j] - pos[i], the vector from i to j
+        diff = pos[np.newaxis, a:] - pos[a:b, np.newaxis]
+        distance = np.abs(diff)
+        near = distance <= min_distance
+        if potential:
+            # The self pairs, at distance 0, are dropped below.
+            with np.errstate(divide='ignore'):
+                inverse = 1/np.maximum(distance, min_distance)
+        # Pairs with j <= i are in earlier rows, or are the body itself.
+        done = np.tri(b - a, dtype=bool)
+        near[:, :b - a] |= done
+        distance[near] = 1
+        # G/d^3 times the vector of length d gives G/d^2.
+        pull = G*diff / distance**3
+        pull[near] = 0
+        acc[a:b] += pull.dot(mass[a:])
+        acc[a:] -= mass[a:b].dot(pull)
+        if potential:
+            inverse[:, :b - a][done] = 0
+            phi[a:b] -= G*inverse.dot(mass[a:])
+            phi[a:] -= G*mass[a:b].dot(inverse)
+    if potential:
+        return acc, phi
+    return acc
+
+def one_sided(pos, mass, G, min_distance, targets):
+    """The accelerations of pos[targets] only, from all bodies."""
+    diff = pos[np.newaxis, :] - pos[targets, np.newaxis]
+    distance = np.abs(diff)
+    # The self interaction has distance 0 and is excluded as well.
+    near = distance <= min_distance
+    distance[near] = 1
+    scale = G * mass[np.newaxis, :] / distance**3
+    scale[near] = 0
+    return (scale*diff).sum(axis=1)
+
+
+################################################################
+#       Tiled direct summation
+################################################################
+# direct() works on strips of STRIP x N pairs, which at 100k bodies
+# are hundreds of MB each. tiled() bounds the work arrays instead: the
+# pair matrix is cut into square tiles that fit in memory bytes,
+# typically in the cache, and the arrays are allocated once and reused
+# by every call with the same memory.
+
+# Memory for the work arrays of tiled(), in bytes
+MEMORY = 8*2**20
+
+# Bytes per pair: diff (complex), distance, cube, near
+PAIR_BYTES = 16 + 8 + 8 + 1
+
+
+class Scratch():
+    def __init__(self, memory):
+        """Work arrays for tiles of as many pairs as fit in memory."""
+        tile = int(np.sqrt(memory/PAIR_BYTES)) // 8 * 8
+        self.tile = tile = max(tile, 8)
+        pairs = tile*tile
+        self.diff = np.empty(pairs, complex)
+        self.distance = np.empty(pairs)
+        self.cube = np.empty(pairs)
+        self.near = np.empty(pairs, bool)
+        # The pairs j <= i of a tile on the diagonal
+        self.lower = np.tri(tile, dtype=bool)
+        self.rows = np.empty(tile, complex)
+        self.columns = np.empty(tile, complex)
+        # The masses as complex numbers, for the dot products
+        self.mass = np.empty(0, complex)
+        # The same for the potentials, as real numbers
+        self.weight = np.empty(0)
+        self.row_phi = np.empty(tile)
+        self.column_phi = np.empty(tile)
+
+    def views(self, rows, columns):
+        """The work arrays for a rows x columns tile, contiguous."""
+        pairs = rows*columns
+        shape = (rows, columns)
+        return (self.diff[:pairs].reshape(shape),
+                self.distance[:pairs].reshape(shape),
+                self.cube[:pairs].reshape(shape),
+                self.near[:pairs].reshape(shape))
+
+# memory -> Scratch
+scratch = {}
+
+def tiled(pos, mass, G=G, min_distance=MIN_DISTANCE, potential=False,
+          memory=MEMORY):
+    """
+    Same as direct(), in tiles within memory bytes. Apart from the
+    returned accelerations nothing is allocated once the work arrays
+    exist. With potential=True, (acc, phi) is returned as by direct(),
+    phi summed in the same tiles.
+    """
+    work = scratch.get(memory)
+    if work is None:
+        work = scratch[memory] = Scratch(memory)
+    n = len(pos)
+    if len(work.mass) < n:
+        work.mass = np.empty(n, complex)
+    masses = work.mass[:n]
+    masses.real = mass
+    masses.imag = 0
+    if potential:
+        if len(work.weight) < n:
+            work.weight = np.empty(n)
+        weights = work.weight[:n]
+        weights[:] = mass
+        phi = np.zeros(n)
+    T = work.tile
+    acc = np.zeros(n, complex)
+    for a in range(0, n, T):
+        b = min(a + T, n)
+        for c in range(a, n, T):
+            d = min(c + T, n)
+            diff, distance, cube, near = work.views(b - a, d - c)
+            # diff[i, j] = pos[j] - pos[i], the vector from i to j
+            np.subtract(pos[np.newaxis, c:d], pos[a:b, np.newaxis], out=diff)
+            np.abs(diff, out=distance)
+            if potential:
+                # 1/d, d no less than min_distance, in cube for now
+                np.maximum(distance, min_distance, out=cube)
+                with np.errstate(divide='ignore'):
+                    np.divide(1, cube, out=cube)
+                if c == a:
+                    np.copyto(cube, 0, where=work.lower[:b - a, :b - a])
+                row_phi = work.row_phi[:b - a]
+                column_phi = work.column_phi[:d - c]
+                np.dot(cube, weights[c:d], out=row_phi)
+                np.dot(weights[a:b], cube, out=column_phi)
+                phi[a:b] -= row_phi
+                phi[c:d] -= column_phi
+            np.less_equal(distance, min_distance, out=near)
+            if c == a:
+                # Pairs with j <= i are done the other way round.
+                np.logical_or(near, work.lower[:b - a, :b - a], out=near)
+            np.copyto(distance, 1, where=near)
+            np.multiply(distance, distance, out=cube)
+            np.multiply(cube, distance, out=cube)
+            # diff/d^3 is the pull towards j, times G below
+            np.divide(diff, cube, out=diff)
+            np.copyto(diff, 0, where=near)
+            rows = work.rows[:b - a]
+            columns = work.columns[:d - c]
+            np.dot(diff, masses[c:d], out=rows)
+            np.dot(masses[a:b], diff, out=columns)
+            acc[a:b] += rows
+            acc[c:d] -= columns
+    acc *= G
+    if potential:
+        phi *= G
+        return acc, phi
+    return acc
+
+
+# Selectable force backends, name -> (module, function).
+# The modules are imported on first use.
+BACKENDS = {
+    'direct': ('forces', 'direct'),
+    'barnes_hut': ('barnes_hut', 'accelerations'),
+    'pool': ('parallel', 'accelerations'),
+    'compiled': ('compiled', 'accelerations'),
+    'tiled': ('forces', 'tiled'),
+    'fmm': ('fmm', 'accelerations'),
+}
+
+# Backends that take targets, computing only some accelerations.
+TARGETED = set(['direct'])
+
+# Backends that take potential=True, returning the potentials as well.
+POTENTIAL = set(['direct', 'compiled', 'tiled'])
+
+# Backends that take radius, returning which bodies overlap as well.
+CONTACTS = set(['compiled'])
+
+def backend(name, **options):
+    """
+    Returns the kernel of the named backend, with options
+    such as theta for barnes_hut bound to it.
+    """
+    module, function = BACKENDS[name]
+    kernel = getattr(importlib.import_module(module), function)
+    if options:
+        kernel = partial(kernel, **options)
+    return kernel
@@ -0,0 +1,92 @@
+"""
+Integrators, selectable by name from INTEGRATORS.
+
+Each integrator advances all bodies that are not fixed by dt:
+    integrator(bodies, dt, accel)
+where accel(pos) returns the accelerations for the positions pos.
+On entry bodies.acc holds the acceleration at bodies.pos and on
+return it holds the acceleration at the new positions, so the last
+force evaluation of a step is reused as the first of the next.
+"""
+
+
+def euler_standard(bodies, dt, accel):
+    # y_{n+1} = y_n + hy'(n)
+    free = ~bodies.is_fixed
+    bodies.pos[free] += bodies.vel[free] * dt
+    bodies.vel[free] += bodies.acc[free] * dt
+    bodies.acc = accel(bodies.pos)
+
+def euler_symplectic(bodies, dt, accel):
+    # y_{n+1} = y_n + hy'(n+1)
+    free = ~bodies.is_fixed
+    bodies.vel[free] += bodies.acc[free] * dt
+    bodies.pos[free] += bodies.vel[free] * dt
+    bodies.acc = accel(bodies.pos)
+
+def verlet(bodies, dt, accel):
+    """
+    Velocity Verlet, the velocity is advanced with the mean of the
+    accelerations before and after the move.
+    """
+    free = ~bodies.is_fixed
+    acc = bodies.acc
+    bodies.pos[free] += bodies.vel[free]*dt + acc[free]*dt**2/2.0
+    bodies.acc = accel(bodies.pos)
+    bodies.vel[free] += (acc[free] + bodies.acc[free])*dt/2.0
+
+def leapfrog(bodies, dt, accel):
+    """Kick-drift-kick leapfrog."""
+    free = ~bodies.is_fixed
+    bodies.vel[free] += bodies.acc[free]*dt/2.0
+    bodies.pos[free] += bodies.vel[free]*dt
+    bodies.acc = accel(bodies.pos)
+    bodies.vel[free] += bodies.acc[free]*dt/2.0
+
+def rk4(bodies, dt, accel):
+    """
+    The standard fourth-order Runge-Kutta method, for y = (pos, vel)
+    and y' = (vel, acc). Not symplectic, the energy drifts slowly.
+    """
+    free = ~bodies.is_fixed
+    pos, vel = bodies.pos, bodies.vel
+
+    def moved(dx):
+        # Fixed bodies stay where they are.
+        new = pos.copy()
+        new[free] += dx[free]
+        return new
+
+    k1v, k1a = vel, bodies.acc
+    k2v = vel + k1a*dt/2.0
+    k2a = accel(moved(k1v*dt/2.0))
+    k3v = vel + k2a*dt/2.0
+    k3a = accel(moved(k2v*dt/2.0))
+    k4v = vel + k3a*dt
+    k4a = accel(moved(k3v*dt))
+
+    bodies.pos = moved((k1v + 2*k2v + 2*k3v + k4v)*dt/6.0)
+    bodies.vel[free] += ((k1a + 2*k2a + 2*k3a + k4a)*dt/6.0)[free]
+    bodies.acc = accel(bodies.pos)
+
+# Yoshida's weights for composing a second-order method into a
+# fourth-order one: steps of w1*dt, w0*dt and w1*dt.
+w1 = 1/(2 - 2**(1/3.))
+w0 = -2**(1/3.)*w1
+
+def yoshida4(bodies, dt, accel):
+    """Fourth-order symplectic, three leapfrog steps of uneven length."""
+    leapfrog(bodies, w1*dt, accel)
+    leapfrog(bodies, w0*dt, accel)
+    leapfrog(bodies, w1*dt, accel)
+
+
+# Selectable integrators, name -> function
+INTEGRATORS = {
+    'euler_standard': euler_standard,
+    'euler_symplectic': euler_symplectic,
+    'verlet': verlet,
+    'leapfrog': leapfrog,
+    'rk4': rk4,
+    'yoshida4': yoshida4,
+}
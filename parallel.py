@@ -0,0 +1,176 @@
+"""
+Direct summation spread over worker processes.
+
+The positions, masses and accelerations live in one block of shared
+memory. For every evaluation the workers each compute the
+accelerations of their own slice of the bodies, from all bodies.
+Nothing but two semaphores passes between the processes per
+evaluation: one per worker to start it, and one they all release
+when done.
+
+The workers are spawned, not forked: a fork after a threaded Numba
+kernel has run (the 'compiled' backend) hangs the interpreter at exit.
+While waiting the caller checks that the workers are alive, so a
+worker that fails raises an error instead of blocking forever.
+
+Needs Python 3.8 or later for multiprocessing.shared_memory.
+"""
+
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory
+import sys
+import time as timer
+
+import numpy as np
+
+import forces
+from forces import G, MIN_DISTANCE
+
+
+# Layout of the shared block, in float64:
+# control (n, G, min_distance, quit), pos (complex), mass, acc (complex)
+CONTROL = 4
+
+# Longest wait for the workers in one evaluation, in seconds
+TIMEOUT = 600
+# How often the caller checks the workers while waiting, in seconds
+POLL = 0.05
+
+def views(buffer, capacity):
+    """The control, pos, mass and acc arrays of a shared block."""
+    block = np.ndarray(CONTROL + 5*capacity, np.float64, buffer)
+    control = block[:CONTROL]
+    pos = block[CONTROL:CONTROL + 2*capacity].view(complex)
+    mass = block[CONTROL + 2*capacity:CONTROL + 3*capacity]
+    acc = block[CONTROL + 3*capacity:].view(complex)
+    return control, pos, mass, acc
+
+def work(name, capacity, go, done, k, processes):
+    """Worker k of processes: computes its slice on every evaluation."""
+    memory = shared_memory.SharedMemory(name)
+    control, pos, mass, acc = views(memory.buf, capacity)
+    while True:
+        go.acquire()
+        n, G, min_distance, quit = control
+        if quit:
+            break
+        n = int(n)
+        a, b = n*k // processes, n*(k + 1) // processes
+        for start in range(a, b, forces.STRIP):
+            end = min(start + forces.STRIP, b)
+            acc[start:end] = forces.one_sided(pos[:n], mass[:n], G,
+                                              min_distance,
+                                              slice(start, end))
+        done.release()
+    del control, pos, mass, acc
+    memory.close()
+
+
+class Pool():
+    def __init__(self, processes=None, capacity=1024, timeout=TIMEOUT):
+        """Starts the worker processes, one per CPU by default."""
+        self.processes = processes or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = []
+        self.start(capacity)
+
+    def start(self, capacity):
+        """Sets up shared memory for capacity bodies and the workers."""
+        self.capacity = capacity
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=8*(CONTROL + 5*capacity))
+        self.control, self.pos, self.mass, self.acc = \
+            views(self.memory.buf, capacity)
+        self.control[:] = 0
+        self.go = [self.context.Semaphore(0) for k in range(self.processes)]
+        self.done = self.context.Semaphore(0)
+        self.workers = [self.context.Process(
+            target=work, args=(self.memory.name, capacity, self.go[k],
+                               self.done, k, self.processes))
+            for k in range(self.processes)]
+        # A spawned process imports the main script again, which for
+        # simulation.py opens a window. The workers only need this
+        # module, so the main script is hidden while they start.
+        main = sys.modules['__main__']
+        hidden = dict((name, main.__dict__.pop(name))
+                      for name in ('__file__', '__spec__')
+                      if name in main.__dict__)
+        main.__spec__ = None
+        try:
+            for worker in self.workers:
+                worker.daemon = True
+                worker.start()
+        finally:
+            main.__dict__.update(hidden)
+
+    def wait(self):
+        """
+        Waits until every worker is done. Raises RuntimeError, with the
+        workers stopped, if one of them exits or they time out.
+        """
+        start = timer.time()
+        for k in range(self.processes):
+            while not self.done.acquire(timeout=POLL):
+                dead = sum(not worker.is_alive() for worker in self.workers)
+                if dead:
+                    self.terminate()
+                    raise RuntimeError("%d of %d force workers failed"
+                                       % (dead, self.processes))
+                if timer.time() - start > self.timeout:
+                    self.terminate()
+                    raise RuntimeError("force workers did not finish "
+                                       "within %g s" % self.timeout)
+
+    def close(self):
+        """Stops the workers and frees the shared memory."""
+        if not self.workers:
+            return
+        self.control[3] = 1
+        for go in self.go:
+            go.release()
+        for worker in self.workers:
+            worker.join(self.timeout)
+        self.terminate()
+
+    def terminate(self):
+        """Kills the workers still running and frees the shared memory."""
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        self.workers = []
+        del self.control, self.pos, self.mass, self.acc
+        self.memory.close()
+        self.memory.unlink()
+
+    def __call__(self, pos, mass, G=G, min_distance=MIN_DISTANCE):
+        """Same call as forces.direct."""
+        n = len(pos)
+        if not self.workers:
+            # Stopped after a failure
+            self.start(max(self.capacity, 2*n))
+        elif n > self.capacity:
+            self.close()
+            self.start(2*n)
+        self.pos[:n] = pos
+        self.mass[:n] = mass
+        self.control[:] = n, G, min_distance, 0
+        for go in self.go:
+            go.release()
+        self.wait()
+        return self.acc[:n].copy()
+
+
+# The pool behind the 'pool' force backend, started on first use.
+pool = None
+
+def accelerations(pos, mass, G=G, min_distance=MIN_DISTANCE,
+                  processes=None):
+    """Force backend using the shared pool of worker processes."""
+    global pool
+    if pool is None:
+        pool = Pool(processes)
+        atexit.register(pool.close)
+    return pool(pos, mass, G, min_distance)
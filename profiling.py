@@ -0,0 +1,133 @@
+"""
+Lightweight timers for the phases of a frame.
+
+    timers = Timers()
+    with timers('force'):
+        ...
+    timers.frame()
+
+The time of every phase is summed over a frame, and the last length
+frames are kept for rolling statistics. Simulation.timers takes a
+Timers to time the force passes and collisions inside the steps; it is
+None by default and then nothing is timed.
+
+Capture runs cProfile for a number of frames, for a closer look.
+"""
+
+import cProfile
+import pstats
+import time
+from collections import deque
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+# The best clock there is
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Timer():
+    """Context manager adding the time spent inside it to a phase."""
+    __slots__ = ('timers', 'name', 'start')
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exception):
+        self.timers.add(self.name, clock() - self.start)
+
+
+class Timers():
+    def __init__(self, length=120):
+        """Keeps the phase times of the last length frames."""
+        self.length = length
+        # name -> seconds so far in this frame
+        self.current = {}
+        # name -> seconds per frame, the last length frames
+        self.history = {}
+        self.frames = 0
+
+    def __call__(self, name):
+        return Timer(self, name)
+
+    def add(self, name, seconds):
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def frame(self):
+        """Ends the current frame."""
+        for name in self.current:
+            if name not in self.history:
+                # Frames before the phase was first timed count as 0.
+                self.history[name] = deque(
+                    [0.0]*min(self.frames, self.length), self.length)
+        for name, history in self.history.items():
+            history.append(self.current.get(name, 0.0))
+        self.current = {}
+        self.frames += 1
+
+    def clear(self):
+        self.current = {}
+        self.history = {}
+        self.frames = 0
+
+    def stats(self):
+        """(name, last, mean, max) per phase in seconds, slowest first."""
+        rows = [(name, history[-1], sum(history)/len(history), max(history))
+                for name, history in self.history.items() if history]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def report(self):
+        """The statistics as a table, milliseconds per frame."""
+        lines = ["%-12s %8s %8s %8s" % ('phase', 'last', 'mean', 'max')]
+        for name, last, mean, most in self.stats():
+            lines.append("%-12s %8.2f %8.2f %8.2f"
+                         % (name, 1e3*last, 1e3*mean, 1e3*most))
+        return '\n'.join(lines)
+
+
+class NoTimer():
+    """Stands in for a Timer when nothing is timed."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+no_timer = NoTimer()
+
+
+class Capture():
+    def __init__(self, frames, path=None):
+        """Runs cProfile for the next frames frames."""
+        self.frames = frames
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def frame(self):
+        """
+        Call once per frame. Returns True when done: the profile is
+        written to path if given.
+        """
+        self.frames -= 1
+        if self.frames > 0:
+            return False
+        self.profile.disable()
+        if self.path:
+            self.profile.dump_stats(self.path)
+        return True
+
+    def report(self, limit=20):
+        """The limit functions with the most cumulative time."""
+        out = StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,159 @@
+"""
+Streaming trajectory recorder.
+
+Every K steps the state of all bodies is copied into a frame. Frames
+are gathered into chunks, and each full chunk is written as one
+compressed .npz segment by a background thread, so the step loop
+never waits for the disk. Bodies come and go between frames (spawned,
+merged away), so every frame stores the stable body ids alongside the
+state. A segment holds the frames concatenated:
+    time[f], offset[f] .. offset[f+1] is the slice of frame f in
+    id, pos, vel, acc, mass, radius, color
+The file 'index' in the directory lists one written segment per line:
+    number, time of the first frame, time of the last frame, frames
+so a recording can be opened and searched without reading segments.
+"""
+
+import os
+import threading
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import numpy as np
+
+
+# The per-body quantities in a frame
+FIELDS = ('id', 'pos', 'vel', 'acc', 'mass', 'radius', 'color')
+
+# Directories of the recordings open in a replay.Replay, never cleared
+playing = set()
+
+
+class Recorder():
+    def __init__(self, directory, every=1, chunk=100):
+        """
+        Records every every-th step into directory, writing a segment
+        for each chunk frames. Raises ValueError if a Replay has the
+        directory open.
+        """
+        if os.path.realpath(directory) in playing:
+            raise ValueError("%s is being replayed" % directory)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # A new recording replaces an old one in the same place.
+        for path in segments(directory) + [os.path.join(directory, 'index')]:
+            if os.path.exists(path):
+                os.remove(path)
+        self.every = every
+        self.chunk = chunk
+        self.steps = 0
+        self.frames = []
+        self.segments = 0
+
+        self.queue = Queue()
+        self.error = None
+        self.writer = threading.Thread(target=self.write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def __call__(self, sim):
+        """Call after every step, e.g. as callback of Simulation.run."""
+        if self.steps % self.every == 0:
+            self.capture(sim)
+        self.steps += 1
+
+    def capture(self, sim):
+        """Copies the current state of sim into a frame."""
+        bodies = sim.bodies
+        frame = dict((name, np.array(getattr(bodies, name)))
+                     for name in FIELDS)
+        frame['color'] = frame['color'].astype(np.float32)
+        frame['time'] = sim.time
+        self.frames.append(frame)
+        if len(self.frames) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        """Hands the gathered frames to the writer thread."""
+        if self.error is not None:
+            raise self.error
+        if not self.frames:
+            return
+        self.queue.put((self.segments, self.frames))
+        self.segments += 1
+        self.frames = []
+
+    def close(self):
+        """Writes what is left and waits for the writer to finish."""
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def write(self):
+        """The writer thread: one compressed segment per chunk."""
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            if self.error is not None:
+                continue
+            number, frames = job
+            try:
+                write_segment(segment_path(self.directory, number), frames)
+                with open(os.path.join(self.directory, 'index'), 'a') as f:
+                    f.write('%d %.17g %.17g %d\n' % (
+                        number, frames[0]['time'], frames[-1]['time'],
+                        len(frames)))
+            except Exception as error:
+                self.error = error
+
+
+def segment_path(directory, number):
+    return os.path.join(directory, 'segment_%06d.npz' % number)
+
+def write_segment(path, frames):
+    """Writes frames as one segment, atomically."""
+    sizes = [len(frame['id']) for frame in frames]
+    arrays = dict(time=np.array([frame['time'] for frame in frames]),
+                  offset=np.r_[0, np.cumsum(sizes)])
+    for name in FIELDS:
+        arrays[name] = np.concatenate([frame[name] for frame in frames])
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temporary, path)
+
+
+def segments(directory):
+    """The paths of all segments in directory, in order."""
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith('segment_') and name.endswith('.npz'))
+    return [os.path.join(directory, name) for name in names]
+
+def frames(directory):
+    """Yields every recorded frame as a dict, in order."""
+    for path in segments(directory):
+        with np.load(path) as segment:
+            data = dict((name, segment[name])
+                        for name in FIELDS + ('time', 'offset'))
+        offset = data['offset']
+        for f, time in enumerate(data['time']):
+            frame = dict((name, data[name][offset[f]:offset[f + 1]])
+                         for name in FIELDS)
+            frame['time'] = time
+            yield frame
+
+def trajectory(directory, id):
+    """The times and positions of the body id, while it existed."""
+    times, positions = [], []
+    for frame in frames(directory):
+        where = np.flatnonzero(frame['id'] == id)
+        if len(where):
+            times.append(frame['time'])
+            positions.append(frame['pos'][where[0]])
+    return np.array(times), np.array(positions)
@@ -0,0 +1,203 @@
+"""
+Batched drawing of all bodies, trails and vectors.
+
+Instead of glBegin/glEnd per shape, the vertices of every shape of a
+kind are built with numpy and copied into one persistent pyglet vertex
+list, so a frame is a handful of draw calls whatever the number of
+bodies. The geometry functions return (vertices, colors) as float32
+arrays of shape (k, 2) and (k, 3).
+
+The detail follows the size on screen: bodies outside the view are
+left out, bodies smaller than a pixel are drawn as points, circles get
+more segments the larger they are, and trails skip points that are
+closer together than a few pixels. The cost of a frame follows what
+is visible rather than the number of bodies.
+"""
+
+import ctypes
+
+import numpy as np
+
+import pyglet
+from pyglet.gl import *
+
+
+# No vertices at all
+NOTHING = np.zeros((0, 2), np.float32), np.zeros((0, 3), np.float32)
+
+# Bodies with a smaller radius on screen, in pixels, are points.
+POINT_RADIUS = 1.0
+# Bounds of the number of segments of a circle
+MIN_SEGMENTS = 4
+MAX_SEGMENTS = 64
+# Trail points closer together on screen than this, in pixels,
+# are skipped.
+TRAIL_SPACING = 3.0
+
+
+def circles(pos, radius, color, segments=8):
+    """
+    Filled circles as triangles, segments per circle, like circle().
+    """
+    angle = 2*np.pi*np.arange(segments + 1)/segments
+    rim = pos[:, np.newaxis] + radius[:, np.newaxis]*np.exp(1j*angle)
+    # Triangle k of a circle: centre, rim[k], rim[k+1]
+    triangles = np.empty((len(pos), segments, 3), complex)
+    triangles[:, :, 0] = pos[:, np.newaxis]
+    triangles[:, :, 1] = rim[:, :-1]
+    triangles[:, :, 2] = rim[:, 1:]
+    return points(triangles.ravel()), \
+           np.repeat(color, segments*3, axis=0).astype(np.float32)
+
+def segment_counts(radius):
+    """
+    Segments for circles of radius pixels, so that the polygon is off
+    the circle by less than half a pixel: r*(1 - cos(pi/k)) < 1/2 for
+    k > pi*sqrt(r). Powers of two, so that few sizes are in use.
+    """
+    wanted = np.pi*np.sqrt(np.maximum(radius, 1))
+    k = 2**np.ceil(np.log2(wanted)).astype(np.int64)
+    return np.clip(k, MIN_SEGMENTS, MAX_SEGMENTS)
+
+def detailed_circles(pos, radius, color, scale=1.0):
+    """circles() with segment_counts() segments, for each size."""
+    counts = segment_counts(radius*scale)
+    shapes = [circles(pos[counts == k], radius[counts == k],
+                      color[counts == k], k) for k in np.unique(counts)]
+    if not shapes:
+        return NOTHING
+    return np.concatenate([v for v, c in shapes]), \
+           np.concatenate([c for v, c in shapes])
+
+def visible(pos, radius, view):
+    """Whether the circles overlap the view, (left, bottom, right, top)."""
+    left, bottom, right, top = view
+    return (pos.real + radius >= left) & (pos.real - radius <= right) & \
+           (pos.imag + radius >= bottom) & (pos.imag - radius <= top)
+
+def lines(start, end, color):
+    """Line segments from start to end, one color per segment."""
+    segments = np.empty((len(start), 2), complex)
+    segments[:, 0] = start
+    segments[:, 1] = end
+    return points(segments.ravel()), \
+           np.repeat(color, 2, axis=0).astype(np.float32)
+
+def points(z):
+    """Complex positions as (k, 2) float32 vertices."""
+    vertices = np.empty((len(z), 2), np.float32)
+    vertices[:, 0] = z.real
+    vertices[:, 1] = z.imag
+    return vertices
+
+def fill(array, data, dtype=np.float32):
+    """Copies a numpy array into a ctypes vertex attribute array."""
+    data = np.ascontiguousarray(data, dtype)
+    ctypes.memmove(array, data.ctypes.data, data.nbytes)
+
+
+class Renderer():
+    def __init__(self):
+        """One batch holding a vertex list per kind of shape."""
+        self.batch = pyglet.graphics.Batch()
+        self.lists = {}
+        # The trails are one indexed vertex list over the ring buffer.
+        self.trails = None
+        self.trails_revision = None
+
+    def set(self, name, mode, vertices, colors):
+        """Replaces the vertices of the named vertex list in place."""
+        count = len(vertices)
+        vertex_list = self.lists.get(name)
+        if vertex_list is None:
+            if not count:
+                return
+            vertex_list = self.batch.add(count, mode, None,
+                                         'v2f/stream', 'c3f/stream')
+            self.lists[name] = vertex_list
+        elif not count:
+            vertex_list.delete()
+            del self.lists[name]
+            return
+        elif vertex_list.get_size() != count:
+            vertex_list.resize(count)
+        fill(vertex_list.vertices, vertices)
+        fill(vertex_list.colors, colors)
+
+    def set_trails(self, trails, color, view=None, scale=1.0):
+        """
+        Uploads the ring buffer of a Trails as it is, one color per
+        body, and draws its segments through the index array. Only the
+        segments inside view are drawn, TRAIL_SPACING pixels apart.
+        """
+        count = len(trails)*trails.length
+        segments = trails.segments(TRAIL_SPACING/scale)
+        if view is not None and len(segments):
+            ends = trails.vertices()[segments]
+            ends = (ends[:, 0] + 1j*ends[:, 1]).reshape(-1, 2)
+            inside = visible(ends, 0, view).any(axis=1)
+            segments = segments.reshape(-1, 2)[inside].ravel()
+        vertex_list = self.trails
+        if not len(segments):
+            if vertex_list is not None:
+                vertex_list.delete()
+                self.trails = None
+            return
+        if vertex_list is None:
+            vertex_list = self.batch.add_indexed(
+                count, GL_LINES, None, [0]*len(segments),
+                'v2f/stream', 'c3f/dynamic')
+            self.trails = vertex_list
+            self.trails_revision = None
+        elif vertex_list.get_size() != count or \
+             len(vertex_list.indices) != len(segments):
+            vertex_list.resize(count, len(segments))
+            self.trails_revision = None
+        fill(vertex_list.vertices, trails.vertices())
+        # The colors only change with the rows.
+        if self.trails_revision != trails.revision:
+            fill(vertex_list.colors, np.repeat(color, trails.length, axis=0))
+            self.trails_revision = trails.revision
+        fill(vertex_list.indices, segments + vertex_list.start, np.uint32)
+
+    def draw(self, bodies, trails=None, vectors=True, view=None, scale=1.0):
+        """
+        Draws all bodies, with the trails if a Trails is given
+        and the velocity and acceleration vectors if vectors is True.
+        view is the visible area (left, bottom, right, top) and scale
+        the pixels per unit, for the level of detail.
+        """
+        pos, radius, color = bodies.pos, bodies.radius, bodies.color
+        if view is not None:
+            shown = visible(pos, radius, view)
+            pos, radius, color = pos[shown], radius[shown], color[shown]
+        point = radius*scale < POINT_RADIUS
+        large = ~point
+        self.set('bodies', GL_TRIANGLES,
+                 *detailed_circles(pos[large], radius[large], color[large],
+                                   scale))
+        self.set('points', GL_POINTS, points(pos[point]),
+                 np.asarray(color[point], np.float32))
+        if trails is not None:
+            self.set_trails(trails, bodies.color, view, scale)
+        elif self.trails is not None:
+            self.trails.delete()
+            self.trails = None
+        if vectors:
+            # Not for the bodies too small to see.
+            if view is not None:
+                shown[shown] = large
+            else:
+                shown = large
+            pos = bodies.pos[shown]
+            n = len(pos)
+            blue = np.tile((0, 0, 1), (n, 1))
+            red = np.tile((1, 0, 0), (n, 1))
+            vel = lines(pos, pos + 1/4.*bodies.vel[shown], blue)
+            acc = lines(pos, pos + 1/8.*bodies.acc[shown], red)
+            self.set('vectors', GL_LINES, np.r_[vel[0], acc[0]],
+                     np.r_[vel[1], acc[1]])
+        else:
+            self.set('vectors', GL_LINES, *NOTHING)
+        glLineWidth(2)
+        self.batch.draw()
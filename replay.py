@@ -0,0 +1,97 @@
+"""
+Playback of recordings made by recorder.Recorder.
+
+Opening a recording only reads its index. Segments are read from disk
+when playback reaches them, and only the last few are kept, so even
+very long recordings start at once and play in constant memory.
+The playback clock runs at speed times real time; frames recorded
+faster than they are shown are simply skipped.
+"""
+
+import os
+
+import numpy as np
+
+from bodies import Bodies
+import recorder
+
+
+class Replay():
+    # Number of segments kept in memory
+    cached = 2
+
+    def __init__(self, directory):
+        """Opens the recording in directory, at its first frame."""
+        self.directory = directory
+        index = os.path.join(directory, 'index')
+        if os.path.exists(index):
+            table = np.loadtxt(index, ndmin=2)
+            self.number = table[:, 0].astype(np.int64)
+            self.first = table[:, 1]
+            self.last = table[:, 2]
+        else:
+            # Recordings without an index, read the times of each segment.
+            self.number, self.first, self.last = [], [], []
+            for k, path in enumerate(recorder.segments(directory)):
+                with np.load(path) as segment:
+                    time = segment['time']
+                self.number.append(k)
+                self.first.append(time[0])
+                self.last.append(time[-1])
+            self.number = np.array(self.number, np.int64)
+            self.first = np.array(self.first)
+            self.last = np.array(self.last)
+        if not len(self.number):
+            raise ValueError("%s holds no recording" % directory)
+
+        # Keeps a Recorder from clearing the directory while it plays.
+        recorder.playing.add(os.path.realpath(directory))
+        self.segments = {}
+        self.speed = 1.0
+        self.time = self.start = self.first[0]
+        self.end = self.last[-1]
+
+    def segment(self, k):
+        """The arrays of segment k, read on first use."""
+        if k not in self.segments:
+            if len(self.segments) >= self.cached:
+                # Forget the segment read first
+                del self.segments[next(iter(self.segments))]
+            path = recorder.segment_path(self.directory, self.number[k])
+            with np.load(path) as segment:
+                self.segments[k] = dict(
+                    (name, segment[name])
+                    for name in recorder.FIELDS + ('time', 'offset'))
+        return self.segments[k]
+
+    def close(self):
+        """Lets the directory be recorded into again."""
+        recorder.playing.discard(os.path.realpath(self.directory))
+        self.segments = {}
+
+    def seek(self, time):
+        """Moves the playback clock to time, within the recording."""
+        self.time = min(max(time, self.start), self.end)
+
+    def advance(self, dt):
+        """Moves the playback clock dt of real time forward."""
+        self.seek(self.time + dt*self.speed)
+
+    def frame(self):
+        """The last recorded frame at or before the playback clock."""
+        k = max(np.searchsorted(self.first, self.time, 'right') - 1, 0)
+        data = self.segment(k)
+        f = max(np.searchsorted(data['time'], self.time, 'right') - 1, 0)
+        a, b = data['offset'][f], data['offset'][f + 1]
+        frame = dict((name, data[name][a:b]) for name in recorder.FIELDS)
+        frame['time'] = data['time'][f]
+        return frame
+
+    def bodies(self):
+        """The frame at the playback clock as Bodies, for drawing."""
+        frame = self.frame()
+        bodies = Bodies(len(frame['id']))
+        for name in recorder.FIELDS:
+            getattr(bodies, name)[:] = frame[name]
+        bodies.next_id = bodies.id.max() + 1 if len(bodies) else 0
+        return bodies
@@ -0,0 +1,56 @@
+"""
+Reproducible initial conditions.
+
+Each scene adds its bodies to a Simulation, centred in its box.
+The scenes taking n and seed give the same bodies for the same seed.
+"""
+
+import numpy as np
+
+import engine
+
+
+def centre(sim):
+    return sim.width/2. + sim.height/2.*1j
+
+def disk(sim, n, seed):
+    """n bodies spread uniformly over a disk, radius 2 to 5."""
+    rng = np.random.RandomState(seed)
+    size = 0.4*min(sim.width, sim.height)
+    r = size*np.sqrt(rng.uniform(0, 1, n))
+    pos = centre(sim) + r*np.exp(2j*np.pi*rng.uniform(0, 1, n))
+    radius = rng.uniform(2, 5, n)
+    color = rng.uniform(.5, 1, (n, 3))
+    return size, sim.add(pos, radius=radius, color=color)
+
+def uniform_disk(sim, n=1000, seed=0):
+    """A uniform disk in rigid rotation, balancing gravity at the edge."""
+    size, ids = disk(sim, n, seed)
+    bodies = sim.bodies
+    new = np.isin(bodies.id, ids)
+    omega = np.sqrt(sim.G*bodies.mass[new].sum()/size**3)
+    bodies.vel[new] = 1j*omega*(bodies.pos[new] - centre(sim))
+
+def cold_collapse(sim, n=1000, seed=0):
+    """A uniform disk at rest, collapsing under its own gravity."""
+    disk(sim, n, seed)
+
+def two_body(sim, n=2, seed=0):
+    """The two bodies of engine.start, orbiting each other."""
+    engine.start(sim)
+
+def sun_earth(sim, n=2, seed=0):
+    """A fixed sun with one planet in a circular orbit, 200 away."""
+    sun = centre(sim)
+    sim.add(sun, radius=50, color=(1, 1, 0), is_fixed=True)
+    speed = np.sqrt(sim.G*sim.bodies.mass[-1]/200.)
+    sim.add(sun + 200j, vel=-speed, radius=5, color=(0, 0, 1))
+
+
+# name -> (scene, whether it takes the number of bodies)
+SCENES = {
+    'uniform_disk': (uniform_disk, True),
+    'cold_collapse': (cold_collapse, True),
+    'two_body': (two_body, False),
+    'sun_earth': (sun_earth, False),
+}
@@ -4,6 +4,9 @@
 __author__ = "Viktor Qvarfordt (viktor.qvarfordt@gmail.com)"
 __date__ = "2011-06-16"
 
+import os
+import sys
+
 import pyglet
 from pyglet.window import mouse, key
 #from pyglet.gl import *
@@ -11,12 +14,21 @@ from pyglet.window import mouse, key
 # This also imports most of the math stuff
 from my_pyglet_functions import *
 
-from random import uniform
-from cmath import phase
-
-# list-like type but more powerful,
-# using this to keep track of the trails
-from collections import deque
+# The headless physics engine and the gravity kernels
+import checkpoint
+import diagnostics
+import engine
+import forces
+import profiling
+import scenes
+import systems
+from camera import Camera
+from recorder import Recorder
+from replay import Replay
+from integrators import INTEGRATORS
+# Draws all bodies with a few batched calls
+from renderer import Renderer
+from trails import Trails
 
 
 ################################################################
@@ -24,25 +36,93 @@ from collections import deque
 ################################################################
 
 
-# Universal constants
-G = 2.8e3 # Universal constant of gravitation
-
 # Global control variables
-steps = 100
 exists_pause = False
-exists_gravity = True
-exists_collision = True
-exists_edge_bounce = False
 
 exists_clear = True
 
 draw_trail = True
 draw_vectors = True
-
-time = 0
+# N toggles the labels with the body ids or names. They are only created while
+# shown, and moved once per drawn frame.
+draw_labels = False
+
+# S saves the state here, L restores it.
+checkpoint_path = 'simulation.checkpoint'
+
+# R starts and stops recording the trajectories into this directory,
+# every record_every steps.
+recording_path = 'recording'
+record_every = 10
+recorder = None
+
+# D toggles the conserved quantities in the info label, measured every
+# monitor_every steps. The time series is kept in monitor.
+monitor_every = 10
+monitor = None
+
+# Time spent in each phase of the frame, O shows it next to the FPS.
+# F2 writes the timings to report_path, F3 runs cProfile for the next
+# profile_frames frames, printing the result and saving it to
+# profile_path (for pstats or snakeviz).
+timers = profiling.Timers()
+draw_profile = False
+report_path = 'timings.txt'
+profile_frames = 100
+profile_path = 'simulation.prof'
+capture = None
+
+# python simulation.py replay <directory> plays a recording instead of
+# simulating. Arrows: left/right seek, up/down change the speed.
+if len(sys.argv) > 2 and sys.argv[1] == 'replay':
+    replay = Replay(sys.argv[2])
+else:
+    replay = None
 
 window = pyglet.window.Window(width=800, height=800, resizable=True)
 
+# The physics, G and the number of steps per visual update live here.
+# The edge bounce box is in world units, the size of the first window.
+sim = engine.Simulation(window.width, window.height, G=2.8e3, steps=100)
+sim.timers = timers
+
+# Maps world units to pixels. Scroll zooms, the middle button pans,
+# M follows the most massive body and H goes back to home, the box.
+camera = Camera(scenes.centre(sim), 1.0, window.width, window.height)
+home = camera.centre, camera.zoom
+
+# Simulated time per second
+time_scale = 1.0
+
+# python simulation.py system <file> loads a planetary system, see
+# systems.py. It runs in units with G = 1, the shortest orbit taking
+# ten seconds, and the labels show the names of the bodies. Bodies
+# added with the mouse are like the lightest body of the system.
+system = None
+system_path = None
+names = {}
+spawn_radius = 20
+spawn_mass = None
+if len(sys.argv) > 2 and sys.argv[1] == 'system':
+    system_path = sys.argv[2]
+    system = systems.load(system_path, sim)
+    names = dict(zip(system.ids, system.names))
+    lightest = sim.bodies.mass.argmin()
+    spawn_radius = sim.bodies.radius[lightest]
+    spawn_mass = sim.bodies.mass[lightest]
+    if system.period:
+        time_scale = system.period/10.
+    home = 0j, 0.45*min(window.width, window.height)
+    camera.centre, camera.zoom = home
+
+# All planets, trails and vectors are drawn by the renderer,
+# all planet labels as one batch.
+renderer = Renderer()
+labels = pyglet.graphics.Batch()
+
+# The last 100 positions of every body
+trails = Trails(length=100)
+
 
 ################################################################
 #       Classes
@@ -50,128 +130,23 @@ window = pyglet.window.Window(width=800, height=800, resizable=True)
 
 
 class Planet():
-    def __init__(self,label=None):
+    def __init__(self, text):
         """
-        Sets up planet attributes:
-        pos, vel, acc, radius, mass, color, trail, is_fixed, label.
+        Sets up the drawing state of a body: label.
+        The physical state is kept in sim.bodies, the trail in trails.
         """
-        self.pos = window.width/2. + window.height/2.*1j
-        self.vel = 0
-        self.acc = 0
-
-        self.radius = 20
-        self.mass = self.radius**2*pi
-
-        self.color = (uniform(.5,1), uniform(.5,1), uniform(.5,1))
-        
-        # An empty deque type, list-like.
-        self.trail = deque(maxlen=100)
-
-        self.is_fixed = False
+        # The labels are drawn together, see labels below.
+        self.label = pyglet.text.Label(text=text, batch=labels)
+        self.pixel = None
 
-        self.label = pyglet.text.Label(
-            text=str(self.vel), x=self.pos.real, y=self.pos.imag)
-
-    def set_acc(self, body):
-        """
-        Adjusts the acceleration variable for self with respect to body
-        according to the gravitational force exerted between them.
-        """
-        argument = phase(body.pos-self.pos)
-        distance = abs(body.pos-self.pos)
-        # There is no gravity if bodies are inside each other.
-        # Normally this never tests as false,
-        # collision will already have happened.
-        if distance > 10:
-            #  F = G*m1*m2/d^2
-            # a1 = F/m1 =>
-            # a1 = G*m2/d^2
-            accModulus = G * body.mass / (distance**2.0) # scalar
-            # updating acceleration
-            self.acc += rect(accModulus, argument)
-
-    def edge_bounce(self, elasticity=1):
-        """
-        Bounce of the window edge.
-        Adjusting body.vel so that: incidence angle = departure angle
-        Takes collission elasticity into account.
-        Pushes back bodies that are located (partially or fully)
-        outside the window edges.
-        """
-        velAbs = abs(self.vel)
-        velArg = phase(self.vel)
-        # Left edge
-        if self.pos.real - self.radius < 0:
-            self.vel = rect(velAbs*elasticity, pi - velArg)
-            self.pos += self.radius - self.pos.real
-        # Right edge
-        elif self.pos.real + self.radius > window.width:
-            self.vel = rect(velAbs*elasticity, pi - velArg)
-            self.pos += window.width - (self.pos.real + self.radius) 
-        # Bottom edge
-        elif self.pos.imag - self.radius < 0:
-            self.vel = rect(velAbs*elasticity, 2*pi - velArg)
-            self.pos += (self.radius - self.pos.imag)*1j
-        # Top edge
-        elif self.pos.imag + self.radius > window.height:
-            self.vel = rect(velAbs*elasticity, 2*pi - velArg)
-            self.pos += (window.height - (self.pos.imag + self.radius))*1j
-
-    def eulerStandard(self, dt):
-        # y_{n+1} = y_n + hy'(n)
-        self.pos += self.vel * dt
-        self.vel += self.acc * dt
-        
-    def eulerSymplectic(self, dt):
-        # y_{n+1} = y_n + hy'(n+1)
-        self.vel += self.acc * dt
-        self.pos += self.vel * dt
-
-    def verlet(self, dt):
-        self.pos += self.vel*dt + self.acc*dt**2/2.0
-        self.vel += self.acc*dt
-    
-    ###
-
-    def get_dx(self, dt, v):
-        dx = v * dt
-        return dx
-
-    def get_dv(self, dt, a):
-        dv = a * dt
-        return dv
-    
-    def rk2(self, dt):
-        dx1 = self.get_dx(dt, self.vel)
-        dx2 = self.get_dx(2*dt, self.vel + dt*dx1)
-        self.pos += (1/3.) * (dx1 + dx2)
-
-        dv1 = self.get_dv(0, self.acc)
-        dv2 = self.get_dv(dt, self.acc + dt*dv1)
-        self.vel += (1/3.) * (dv1 + dv2)
-
-    ###
-
-    def update(self):
-        # self.mass = self.radius**2*pi
-        self.label.x = self.pos.real
-        self.label.y = self.pos.imag
-
-    def draw(self):
-        # Planet
-        glColor3f(self.color[0], self.color[1], self.color[2])
-        circle(self.pos, self.radius)
-        # Trail
-        if draw_trail:
-            trail(self.trail)
-        # velocity & acceleration
-        if draw_vectors:
-            glColor3f(0,0,1)
-            line(self.pos, self.pos + 1/4.*self.vel, 2)
-            glColor3f(1,0,0)
-            line(self.pos, self.pos + 1/8.*self.acc, 2)
-        # Label
-        self.label.draw()
+    def update(self, pos):
+        # Moving a label lays it out again, so only whole pixels count.
+        pixel = (int(pos.real), int(pos.imag))
+        if pixel != self.pixel:
+            self.pixel = pixel
+            self.label.begin_update()
+            self.label.x, self.label.y = pixel
+            self.label.end_update()
 
 
 class Line():
@@ -199,11 +174,12 @@ class Circle():
 
 myLine = Line()
 myCircle = Circle()
-# massCenter = Circle()
-# massCenter.radius = 5
+# Shown while the diagnostics are on
+massCenter = Circle()
+massCenter.radius = 5
 
-# Container for all planet objects
-planets = []
+# Container for all planet objects, by body id
+planets = {}
 
 
 # myLabel = pyglet.text.Label(
@@ -211,59 +187,62 @@ planets = []
 infoLabel = pyglet.text.Label(
     anchor_x='right', anchor_y='top', multiline=True, width=500)
 infoLabel.document.set_style(0, len(infoLabel.text), dict(align='right'))
+# The info label is updated every hud_every frames, and right away
+# when hud_stale is set.
+hud_every = 20
+hud_stale = True
+# Above the FPS display
+profileLabel = pyglet.text.Label(
+    x=10, y=40, anchor_y='bottom', multiline=True, width=400,
+    font_name='Courier New', font_size=10)
 
 
 
 ################################################################
 #       Functions
 ################################################################
-# This set of functions assumes their arguments to have
-# arg.pos and arg.vel represented as complex numbers.
 
 
 def start():
-    exists_solarSystem = False
-    a = Planet()
-    a.pos = window.width/2. + window.height/2.*1j-100j
-    a.vel = 100
-    a.radius = 20
-    planets.append(a)
-    
-    a = Planet()
-    a.pos = window.width/2. + window.height/2.*1j+100j
-    a.vel = -100
-    a.radius = 20
-    planets.append(a)
-
-def body_collision(p1, p2):
-    """
-    A perfectly inelastic collision between p1 and p2.
-    The larger body will consume the smaller.
-    Momentum is conserved.
-    """
-    distance = abs(p2.pos - p1.pos)
-    comb_radius = p1.radius + p2.radius
-    momentum =  p1.mass*abs(p1.vel) + p2.mass*abs(p2.vel)
-
-    # Collision will occur when planets are overlapping.
-    if distance < comb_radius: 
-        # Always let the larger body consume the smaller.
-        if p1.mass > p2.mass:
-            # Fuse masses.
-            p1.mass = p1.mass + p2.mass
-            # Change radius to reflect the new mass.
-            # 1 mass unit = 1 pixel => mass = area => radius = sqrt(mass/pi)
-            p1.radius = sqrt(p1.mass/pi)
-            # Momentum: m1*v1 + m2*v2 = (m1+m2)*v_total
-            # p1 is now the fused mass. so p1.vel is v_total
-            p1.vel = (p1.mass*p1.vel + p2.mass*p2.vel) / (p1.mass + p2.mass)
-            # The consumed planet is removed
-            planets.remove(p2)
-        else:  # p2 is the big one. or p1.mass == p2.mass.
-            p2.mass = p1.mass + p2.mass
-            p2.radius = sqrt(p2.mass/pi)
-            p2.vel = (p2.mass*p2.vel + p1.mass*p1.vel) / (p2.mass + p1.mass)
-            planets.remove(p1)
+    """The two body start, or the loaded system as it was loaded."""
+    global system, names
+    if system is None:
+        engine.start(sim)
+        return
+    system = systems.load(system_path, sim)
+    names = dict(zip(system.ids, system.names))
+    clear_labels()
+
+def set_text(label, text):
+    """Changes the text of label only if it differs, saving the layout."""
+    if label.text != text:
+        label.text = text
+
+def clear_labels():
+    for p in planets.values():
+        p.label.delete()
+    planets.clear()
+
+def sync_labels():
+    """One label per body, at the body."""
+    bodies = sim.bodies
+    # Drop the planets that were consumed in a collision.
+    for id in set(planets).difference(bodies.id):
+        planets[id].label.delete()
+        del planets[id]
+    for id, pos in zip(bodies.id, bodies.pos):
+        if id not in planets:
+            planets[id] = Planet(names.get(id, str(id)))
+        planets[id].update(camera.to_screen(pos))  # Taking care of labels.
+
+def step_callback(sim):
+    """Called after every step: recording and diagnostics."""
+    if recorder is not None:
+        with timers('record'):
+            recorder(sim)
+    if monitor is not None:
+        with timers('diagnostics'):
+            monitor(sim)
 
 def body_bounce(body1, body2):
     """Incomplete"""
@@ -277,9 +256,7 @@ def body_bounce(body1, body2):
 @window.event
 def on_mouse_press(x, y, button, modifiers):
     if button == mouse.RIGHT:
-        newPlanet = Planet()
-        newPlanet.pos = x + y*1j
-        planets.append(newPlanet)
+        sim.add(camera.to_world(x, y), radius=spawn_radius, mass=spawn_mass)
     elif button == mouse.LEFT:
         myLine.start = x+y*1j
         myLine.end = myLine.start
@@ -289,10 +266,10 @@ def on_mouse_press(x, y, button, modifiers):
 @window.event
 def on_mouse_release(x, y, button, modifiers):
     if button == mouse.LEFT:
-        newPlanet = Planet()
-        newPlanet.pos = myLine.start
-        newPlanet.vel = myLine.end - myLine.start
-        planets.append(newPlanet)
+        # The line is in pixels, the body in world units.
+        sim.add(camera.to_world(myLine.start.real, myLine.start.imag),
+                vel=(myLine.end - myLine.start)/camera.zoom,
+                radius=spawn_radius, mass=spawn_mass)
         myCircle.active = False
         
         myLine.start = 0
@@ -302,6 +279,12 @@ def on_mouse_release(x, y, button, modifiers):
 def on_mouse_drag(x, y, dx, dy, buttons, modifiers):
     if buttons == 1: # 1::lmb 4::rmb
         myLine.end = x+y*1j
+    if buttons == mouse.MIDDLE:
+        camera.pan(dx, dy)
+
+@window.event
+def on_mouse_scroll(x, y, scroll_x, scroll_y):
+    camera.zoom_at(x, y, 1.25**scroll_y)
 
 @window.event
 def on_key_press(symbol, modifiers):
@@ -317,11 +300,7 @@ def on_key_press(symbol, modifiers):
             exists_pause = True
     # Toggle gravity on/off
     if symbol == key.G:
-        global exists_gravity
-        if exists_gravity:
-            exists_gravity = False
-        else:
-            exists_gravity = True
+        sim.exists_gravity = not sim.exists_gravity
     # Toggle vectors on/off
     if symbol == key.V:
         global draw_vectors
@@ -329,6 +308,12 @@ def on_key_press(symbol, modifiers):
             draw_vectors = False
         else:
             draw_vectors = True
+    # Toggle labels on/off
+    if symbol == key.N:
+        global draw_labels
+        draw_labels = not draw_labels
+        if not draw_labels:
+            clear_labels()
     # Toggle trails on/off
     if symbol == key.T:
         global draw_trail
@@ -338,26 +323,100 @@ def on_key_press(symbol, modifiers):
             draw_trail = True
     # Clear all planets
     if symbol == key.SPACE:
-        global planets
-        planets = []
+        sim.clear()
+        clear_labels()
     # Toggle collision on/off
     if symbol == key.C:
-        global exists_collision
-        if exists_collision:
-            exists_collision = False
-        else:
-            exists_collision = True
-    # Spawn predefined planets
+        sim.exists_collision = not sim.exists_collision
+    # Spawn predefined planets, or load the system again
     if symbol == key.F1:
         start()
+    # Cycle through the force backends
+    if symbol == key.F:
+        names = sorted(forces.BACKENDS)
+        sim.set_force(names[(names.index(sim.force_backend)+1) % len(names)])
+    # Cycle through the integrators
+    if symbol == key.I:
+        names = sorted(INTEGRATORS)
+        sim.set_integrator(
+            names[(names.index(sim.integrator_name)+1) % len(names)])
+    # Toggle adaptive block timesteps on/off
+    if symbol == key.A:
+        sim.exists_adaptive = not sim.exists_adaptive
+    # Seek and change speed of the replay
+    if replay is not None:
+        if symbol == key.LEFT:
+            replay.seek(replay.time - replay.speed)
+        if symbol == key.RIGHT:
+            replay.seek(replay.time + replay.speed)
+        if symbol == key.UP:
+            replay.speed *= 2
+        if symbol == key.DOWN:
+            replay.speed /= 2
+    # Start/stop recording, not while a recording is replayed
+    if symbol == key.R and replay is None:
+        global recorder
+        if recorder is None:
+            recorder = Recorder(recording_path, every=record_every)
+        else:
+            recorder.close()
+            recorder = None
+    # Save and restore the state, also not in a replay
+    if symbol == key.S and replay is None:
+        checkpoint.save(sim, checkpoint_path)
+    if symbol == key.L and replay is None and \
+       os.path.exists(checkpoint_path):
+        checkpoint.load(checkpoint_path, sim)
+    # Camera: follow the most massive body, back to the box
+    if symbol == key.M:
+        if camera.follow is None and len(sim.bodies):
+            camera.follow = sim.bodies.id[sim.bodies.mass.argmax()]
+        else:
+            camera.follow = None
+    if symbol == key.H:
+        camera.follow = None
+        camera.centre, camera.zoom = home
     # Toggle edge bounce on/off
     if symbol == key.B:
-        global exists_edge_bounce
-        if exists_edge_bounce:
-            exists_edge_bounce = False
+        sim.exists_edge_bounce = not sim.exists_edge_bounce
+    # Toggle the diagnostics on/off
+    if symbol == key.D:
+        global monitor
+        if monitor is None:
+            monitor = diagnostics.Monitor(every=monitor_every, length=10000)
         else:
-            exists_edge_bounce = True
+            monitor = None
+        sim.exists_diagnostics = monitor is not None
+    # Profiling: overlay, report and cProfile capture
+    if symbol == key.O:
+        global draw_profile
+        draw_profile = not draw_profile
+        set_text(profileLabel, timers.report())
+    if symbol == key.F2:
+        with open(report_path, 'w') as f:
+            f.write(timers.report() + '\n')
+    if symbol == key.F3:
+        global capture
+        if capture is None:
+            capture = profiling.Capture(profile_frames, profile_path)
         
+@window.event
+def on_key_release(symbol, modifiers):
+    # Any key may have changed a setting shown in the info label.
+    global hud_stale
+    hud_stale = True
+
+@window.event
+def on_close():
+    # The writer thread is a daemon, the frames still queued are
+    # written before the window goes. The default handler closes it.
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
+    if replay is not None:
+        replay.close()
+
 @window.event
 def on_text(text):
     if text == "C":
@@ -366,20 +425,19 @@ def on_text(text):
             exists_clear = False
         else:
             exists_clear = True
-    # Change number of Euler steps
-    global steps
+    # Change number of steps
     if text == "1":
-        steps = 1.
+        sim.steps = 1
     if text == "2":
-        steps = 20.
+        sim.steps = 20
     if text == "3":
-        steps = 50.
+        sim.steps = 50
     if text == "4":
-        steps = 100.
+        sim.steps = 100
     if text == "5":
-        steps = 500.
+        sim.steps = 500
     if text == "6":
-        steps = 1000.
+        sim.steps = 1000
 
 
 
@@ -389,53 +447,52 @@ def on_text(text):
 
 
 def update(dt):
-    if not exists_pause:
-        # Preform the calculations $steps times per visual update.
-        dt = float(dt / steps)
-        for count in range(steps):
-            for p1 in planets:
-                p1.acc = 0
-                for p2 in planets:
-                    # Checks so that the planets haven't been removed
-                    # (in a collision) and are still in the list.
-                    if p1 != p2 and p1 in planets and p2 in planets:
-                        if exists_gravity:
-                            p1.set_acc(p2)
-                        if exists_collision:
-                            body_collision(p1, p2)
-                
-                if not p1.is_fixed:
-                    if exists_edge_bounce:
-                        p1.edge_bounce()
-                    p1.verlet(dt)
-                    #p1.rk2(dt)
-                    p1.update()  # Taking care of labels.
-
-
-    # # Stuff that needs no high precicion.
-    # # Calculating the total momentum.
-    # momentumTotal = 0
-    # massTotal = 0
-    # posTotal = 0
-    # for planet in planets:
-    #     momentumTotal += planet.mass*planet.vel
-    #     massTotal += planet.mass
-    #     posTotal += planet.pos*planet.mass
-                
-    #     momentumTotal = abs(momentumTotal)
-                
-    # # Mass center, incomplete.
-    #     if len(planets) >= 2:
-    #         massCenter.active = True
-    #         massCenter.pos = posTotal / (len(planets)+massTotal)
-    #     else:
-    #         massCenter.active = False
-                
-    # infoLabel.text = 'Active planets: %d\nTotal momentum: %d' %(len(planets), momentumTotal)
-    
-    infoLabel.text = "Active planets: %d\nEuler steps: %d\nGravity: %s\nCollision: %s\nEdge bounce: %s" %(len(planets), steps, exists_gravity, exists_collision, exists_edge_bounce)
-    infoLabel.x = window.width
-    infoLabel.y = window.height
+    with timers('physics'):
+        if replay is not None:
+            # Show the recorded frame instead of simulating.
+            if not exists_pause:
+                replay.advance(dt)
+            sim.bodies = replay.bodies()
+            sim.time = replay.time
+        elif not exists_pause and len(sim.bodies):
+            # Preform the calculations sim.steps times per visual update.
+            sim.advance(dt*time_scale, step_callback)
+
+    with timers('hud'):
+        update_hud()
+
+
+def update_hud():
+    """
+    The numbers in the info label change all the time, it is redone
+    every hud_every frames or when a setting changed.
+    """
+    global hud_stale
+    last = monitor.last() if monitor is not None else None
+    massCenter.active = last is not None and last['n'] >= 2
+    if massCenter.active:
+        massCenter.pos = camera.to_screen(last['centre'])
+    if hud_stale or timers.frames % hud_every == 0:
+        hud_stale = False
+        if sim.exists_adaptive and len(sim.levels):
+            integrator = "block leapfrog, finest level %d" % sim.levels.max()
+        else:
+            integrator = sim.integrator_name
+        text = "Active planets: %d\nSteps: %d (%s)\nGravity: %s (%s)\nCollision: %s\nEdge bounce: %s" %(len(sim.bodies), sim.steps, integrator, sim.exists_gravity, sim.force_backend, sim.exists_collision, sim.exists_edge_bounce)
+        if system is not None:
+            text += "\nTime: %.1f days" %(sim.time*system.time/86400)
+        # Stuff that needs no high precision.
+        if last is not None:
+            energy, momentum, angular = monitor.drift()
+            text += "\nEnergy: %.4g (drift %.2e)\nMomentum: %.4g (drift %.2g)\nAngular momentum: %.4g (drift %.2g)" %(last['energy'], energy, abs(last['momentum']), abs(momentum), last['angular_momentum'], angular)
+        # The text is laid out again only when it changes.
+        set_text(infoLabel, text)
+    if (infoLabel.x, infoLabel.y) != (window.width, window.height):
+        infoLabel.begin_update()
+        infoLabel.x, infoLabel.y = window.width, window.height
+        infoLabel.end_update()
+    if draw_profile and timers.frames % hud_every == 0:
+        set_text(profileLabel, timers.report())
             
 
 # Is this anything more than FPS cap?
@@ -446,25 +503,46 @@ glClearColor(0,0,0,1)
 
 @window.event
 def on_draw():
+    global capture
     if exists_clear:
         window.clear()
 
     # Drawing all planets
-    for p in planets:
+    bodies = sim.bodies
+    camera.resize(window.width, window.height)
+    camera.track(bodies)
+    with timers('trails'):
+        trails.sync(bodies.id)
         if draw_trail:
-            p.trail.append(p.pos)
-        elif p.trail:
-            p.trail = []
-        p.draw()
+            trails.append(bodies.pos)
+        else:
+            trails.clear()
+    with timers('draw'):
+        camera.begin()
+        renderer.draw(bodies, trails if draw_trail else None, draw_vectors,
+                      camera.view(), camera.zoom)
+        camera.end()
+    if draw_labels:
+        with timers('labels'):
+            sync_labels()
+            labels.draw()
 
     glColor3f(1,1,1)
     myLine.draw()
     myCircle.draw()
 
-    # glColor3f(1,1,0)
-    # massCenter.draw()
+    glColor3f(1,1,0)
+    massCenter.draw()
+
+    with timers('hud'):
+        infoLabel.draw()
+        fps_display.draw()
+        if draw_profile:
+            profileLabel.draw()
 
-    infoLabel.draw()
-    fps_display.draw()
+    timers.frame()
+    if capture is not None and capture.frame():
+        print(capture.report())
+        capture = None
 
 pyglet.app.run()
@@ -0,0 +1,72 @@
+"""
+Uniform grid broad phase for finding overlapping bodies.
+
+Every body is put in each grid cell its bounding square touches, so
+bodies grown large by merging are found without making every cell
+large. Only bodies sharing a cell are tested against each other.
+"""
+
+import numpy as np
+
+from barnes_hut import ranks
+
+
+# Below this many bodies all pairs are simply tested,
+# building the grid costs more than it saves.
+DENSE = 64
+
+
+def cell_size(radius):
+    """Twice the median radius, most bodies then touch 1 to 4 cells."""
+    return 2*np.median(radius) or 1.0
+
+def overlapping_pairs(pos, radius, cell=None):
+    """
+    Returns the index arrays (i, j), i < j, of every pair of bodies
+    that overlap: |pos[i] - pos[j]| < radius[i] + radius[j]
+    """
+    n = len(pos)
+    none = np.zeros(0, np.int64)
+    if n < 2:
+        return none, none
+    if n <= DENSE:
+        distance = np.abs(pos[np.newaxis, :] - pos[:, np.newaxis])
+        comb_radius = radius[np.newaxis, :] + radius[:, np.newaxis]
+        return np.nonzero(np.triu(distance < comb_radius, 1))
+    if cell is None:
+        cell = cell_size(radius)
+
+    # The range of cells covered by each body
+    x0 = np.floor((pos.real - radius)/cell).astype(np.int64)
+    y0 = np.floor((pos.imag - radius)/cell).astype(np.int64)
+    nx = np.floor((pos.real + radius)/cell).astype(np.int64) - x0 + 1
+    ny = np.floor((pos.imag + radius)/cell).astype(np.int64) - y0 + 1
+
+    # One entry per (body, cell)
+    counts = nx*ny
+    body = np.repeat(np.arange(n), counts)
+    k = ranks(counts)
+    cx = x0[body] + k % nx[body]
+    cy = y0[body] + k // nx[body]
+    key = (cx - cx.min())*(cy.max() - cy.min() + 1) + (cy - cy.min())
+
+    order = np.argsort(key, kind='stable')
+    key, body = key[order], body[order]
+
+    # Every entry is paired with the entries after it in its cell.
+    first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    size = np.diff(np.r_[first, len(key)])
+    end = np.repeat(first + size, size)
+    after = end - np.arange(len(key)) - 1
+    a = np.repeat(np.arange(len(key)), after)
+    b = a + 1 + ranks(after)
+    i = np.minimum(body[a], body[b])
+    j = np.maximum(body[a], body[b])
+
+    # A pair sharing several cells is only kept once.
+    pair = np.unique(i*n + j)
+    i, j = pair // n, pair % n
+
+    # Narrow phase
+    touching = np.abs(pos[i] - pos[j]) < radius[i] + radius[j]
+    return i[touching], j[touching]
@@ -0,0 +1,146 @@
+"""
+Planetary systems read from a description file.
+
+A description is a JSON file like systems/solar.json:
+    {
+        "units": {"length": 1.495978707e11, "mass": 1, "time": 86400},
+        "softening": 0,
+        "bodies": [
+            {"name": "Sun", "mass": 1.98847e30, "radius": 0.00465,
+             "color": [1, 1, 0]},
+            {"name": "Earth", "mass": 5.97237e24, "radius": 4.26e-5,
+             "orbit": {"around": "Sun", "a": 1.0, "e": 0.0167,
+                       "periapsis": 102.9, "anomaly": 357.5}},
+            {"name": "Probe", "mass": 1000, "pos": [1.1, 0],
+             "vel": [0, 0.0165]}
+        ]
+    }
+units gives the size of the units of the file in SI (m, kg, s), SI if
+left out. A body is given either by its state, pos and vel, or by its
+orbit around a body before it: semi-major axis a, eccentricity e, the
+argument of periapsis and the mean anomaly in degrees. radius, color
+and fixed are optional.
+
+All quantities are converted once, at load, to simulation units with
+G = 1: the unit of mass is the total mass, the unit of length the
+largest distance from the centre of mass, and the unit of time follows
+as sqrt(length^3/(G*mass)). Masses of 1e30 and distances of 1e11 never
+meet in the force passes, and nothing is converted per pair.
+"""
+
+import json
+from math import cos, pi, radians, sin, sqrt
+
+import numpy as np
+
+
+# Universal constant of gravitation, in SI units
+G = 6.674e-11
+
+
+class System():
+    def __init__(self, names, ids, length, mass, time, period):
+        """
+        The bodies of a loaded system, by name and body id. length,
+        mass and time are the simulation units in SI, period the
+        shortest orbital period in simulation units, None if there
+        are no orbits.
+        """
+        self.names = names
+        self.ids = ids
+        self.length = length
+        self.mass = mass
+        self.time = time
+        self.period = period
+
+
+def kepler(M, e, tolerance=1e-14):
+    """The eccentric anomaly E for the mean anomaly M = E - e*sin(E)."""
+    E = M if e < 0.8 else pi
+    for i in range(100):
+        step = (E - e*sin(E) - M)/(1 - e*cos(E))
+        E -= step
+        if abs(step) < tolerance:
+            break
+    return E
+
+def orbit_state(mu, a, e, periapsis=0, anomaly=0):
+    """
+    Position and velocity (complex) relative to the central body of a
+    Kepler orbit, mu = G*(M + m), angles in degrees.
+    """
+    E = kepler(radians(anomaly) % (2*pi), e)
+    n = sqrt(mu/a**3)
+    b = a*sqrt(1 - e**2)
+    rate = n/(1 - e*cos(E))  # dE/dt
+    pos = a*(cos(E) - e) + b*sin(E)*1j
+    vel = (-a*sin(E) + b*cos(E)*1j)*rate
+    turn = np.exp(1j*radians(periapsis))
+    return pos*turn, vel*turn
+
+
+def load(path, sim):
+    """
+    Replaces the bodies of sim with the system described in path, in
+    simulation units centred on 0, and sets sim.G, sim.min_distance and
+    sim.length, the length scale of the adaptive timesteps, to the
+    closest distance between two bodies. Returns the System.
+    """
+    with open(path) as f:
+        description = json.load(f)
+    units = description.get('units', {})
+    length_unit = units.get('length', 1.0)
+    mass_unit = units.get('mass', 1.0)
+    time_unit = units.get('time', 1.0)
+    # G in the units of the file
+    g = G*mass_unit*time_unit**2/length_unit**3
+
+    entries = description['bodies']
+    n = len(entries)
+    names = [entry.get('name', str(k)) for k, entry in enumerate(entries)]
+    mass = np.array([float(entry['mass']) for entry in entries])
+    pos = np.zeros(n, complex)
+    vel = np.zeros(n, complex)
+    periods = []
+    for k, entry in enumerate(entries):
+        if 'orbit' in entry:
+            orbit = dict(entry['orbit'])
+            around = names.index(orbit.pop('around'))
+            if around >= k:
+                raise ValueError("%s orbits %s, which is not listed before it"
+                                 % (names[k], names[around]))
+            mu = g*(mass[around] + mass[k])
+            p, v = orbit_state(mu, **orbit)
+            pos[k] = pos[around] + p
+            vel[k] = vel[around] + v
+            periods.append(2*pi*sqrt(orbit['a']**3/mu))
+        else:
+            pos[k] = complex(*entry.get('pos', (0, 0)))
+            vel[k] = complex(*entry.get('vel', (0, 0)))
+    fixed = np.array([bool(entry.get('fixed', False)) for entry in entries])
+
+    # The centre of mass at rest at 0, unless a body is held fixed.
+    total = mass.sum()
+    pos -= mass.dot(pos)/total
+    if not fixed.any():
+        vel -= mass.dot(vel)/total
+
+    # The simulation units, in the units of the file
+    length = np.abs(pos).max() or 1.0
+    time = sqrt(length**3/(g*total))
+
+    radius = np.array([float(entry.get('radius', 0)) for entry in entries])
+    color = [entry.get('color') or
+             [sim.random.uniform(.5, 1) for i in range(3)]
+             for entry in entries]
+    sim.clear()
+    sim.time = 0
+    sim.G = 1.0
+    sim.min_distance = description.get('softening', 0)/length
+    if n > 1:
+        distance = np.abs(pos[:, np.newaxis] - pos[np.newaxis])
+        sim.length = distance[np.triu_indices(n, 1)].min()/length
+    ids = sim.add(pos/length, vel*time/length, radius/length, mass/total,
+                  color, fixed)
+    return System(names, list(ids), length*length_unit, total*mass_unit,
+                  time*time_unit, min(periods)/time if periods else None)
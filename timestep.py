@@ -0,0 +1,82 @@
+"""
+Adaptive, hierarchical block timesteps.
+
+Every body gets its own timestep from its acceleration,
+    dt_i = eta*sqrt(length/|a_i|)
+rounded down to dt/2^k for a level k = 0..max_level, where dt is the
+length of the whole block step. Bodies on level k are kicked 2^k times
+per block step while the others wait, so a close binary takes many
+small steps without dragging every other body along.
+
+The scheme is kick-drift-kick leapfrog per level: all positions drift
+from one step end to the next, and only the bodies at the end of their
+own step have their acceleration recomputed and their velocity kicked.
+"""
+
+import numpy as np
+
+import forces
+
+
+def levels(acc, dt, eta, length, max_level):
+    """The level of each body for the acceleration acc."""
+    magnitude = np.abs(acc)
+    level = np.zeros(len(acc), np.int64)
+    pulled = magnitude > 0
+    wanted = eta*np.sqrt(length/magnitude[pulled])
+    level[pulled] = np.ceil(np.log2(dt/wanted))
+    return np.clip(level, 0, max_level)
+
+def block_step(sim, dt):
+    """
+    Advances sim by dt with block timesteps, using sim.eta,
+    sim.length and sim.max_level. Returns the levels used.
+    """
+    bodies = sim.bodies
+    if not len(bodies):
+        return np.zeros(0, np.int64)
+    free = ~bodies.is_fixed
+    top = sim.max_level
+    h = float(dt) / 2**top  # the finest step
+    level = levels(bodies.acc, dt, sim.eta, sim.length, top)
+    used = level.copy()
+
+    # Only the ticks where some body ends its step are visited.
+    tick = 0
+    while tick < 2**top:
+        # Length of each body's own step, in finest steps
+        period = 2**(top - level)
+        starting = free & (tick % period == 0)
+        bodies.vel[starting] += bodies.acc[starting]*period[starting]*h/2.0
+
+        following = ((tick // period + 1)*period).min()
+        bodies.pos[free] += bodies.vel[free]*(following - tick)*h
+        tick = following
+
+        targets = np.flatnonzero(tick % period == 0)
+        bodies.acc[targets] = accel(sim, targets)
+        kicked = targets[free[targets]]
+        bodies.vel[kicked] += bodies.acc[kicked]*period[kicked]*h/2.0
+
+        # New levels for the bodies that just finished a step. A finer
+        # level is always in step, a coarser one only at its own ticks.
+        new = levels(bodies.acc[targets], dt, sim.eta, sim.length, top)
+        while True:
+            behind = tick % 2**(top - new) != 0
+            if not behind.any():
+                break
+            new[behind] += 1
+        level[targets] = new
+        used = np.maximum(used, level)
+    return used
+
+def accel(sim, targets):
+    """The accelerations of the bodies at the indices targets."""
+    bodies = sim.bodies
+    if not sim.exists_gravity:
+        return np.zeros(len(targets), complex)
+    if sim.force_backend in forces.TARGETED:
+        with sim.timer('force'):
+            return sim.force(bodies.pos, bodies.mass, sim.G,
+                             sim.min_distance, targets=targets)
+    return sim.accel(bodies.pos)[targets]
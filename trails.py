@@ -0,0 +1,112 @@
+"""
+Trails of all bodies in one preallocated ring buffer.
+
+buffer[row, slot] holds the (x, y) of a body at some earlier frame.
+All bodies are recorded at the same time, so one head index tells
+which slot is written next, for every row. The rows follow the order
+of the bodies; they are kept in step with sync(), by id.
+"""
+
+import numpy as np
+
+
+class Trails():
+    def __init__(self, length=100, capacity=64):
+        """Room for capacity bodies with length points each."""
+        self.length = length
+        self.buffer = np.zeros((capacity, length, 2), np.float32)
+        # Number of recorded points in each row, at most length.
+        self.count = np.zeros(capacity, np.int64)
+        self.id = np.zeros(capacity, np.int64)
+        self.n = 0
+        self.head = 0
+        # Changes whenever rows are added or removed.
+        self.revision = 0
+
+    def __len__(self):
+        return self.n
+
+    def sync(self, ids):
+        """
+        Makes the rows match the bodies with the given ids (in order).
+        Rows are matched by id, so the bodies may come in any order:
+        a body keeps its trail, bodies not seen before get empty rows.
+        """
+        ids = np.asarray(ids)
+        if self.n == len(ids) and (self.id[:self.n] == ids).all():
+            return
+        # The row of every body, if it has one
+        row = np.zeros(len(ids), np.int64)
+        known = np.zeros(len(ids), bool)
+        if self.n:
+            old = self.id[:self.n]
+            sort = np.argsort(old)
+            row = sort[np.minimum(np.searchsorted(old[sort], ids),
+                                  self.n - 1)]
+            known = old[row] == ids
+        n = len(ids)
+        if n > len(self.buffer):
+            self.grow(n)
+        # The gathered rows are copies, so rows may move over each other.
+        self.buffer[:n][known] = self.buffer[row[known]]
+        self.count[:n] = np.where(known, self.count[row], 0)
+        self.id[:n] = ids
+        self.n = n
+        self.revision += 1
+
+    def grow(self, n):
+        """Makes room for at least n bodies, doubling the capacity."""
+        capacity = max(n, 2*len(self.buffer))
+        for name in ('buffer', 'count', 'id'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def append(self, pos):
+        """Records the positions (complex array) of all bodies."""
+        self.buffer[:self.n, self.head, 0] = pos.real
+        self.buffer[:self.n, self.head, 1] = pos.imag
+        self.head = (self.head + 1) % self.length
+        self.count[:self.n] = np.minimum(self.count[:self.n] + 1,
+                                         self.length)
+
+    def clear(self):
+        """Forgets all recorded points, but keeps the rows."""
+        self.count[:] = 0
+
+    def vertices(self):
+        """All slots of the used rows as (n*length, 2), without copying."""
+        return self.buffer[:self.n].reshape(-1, 2)
+
+    def lengths(self):
+        """The length of every trail, along its points."""
+        pairs = self.segments().reshape(-1, 2)
+        vertices = self.vertices()
+        step = vertices[pairs[:, 1]] - vertices[pairs[:, 0]]
+        return np.bincount(pairs[:, 0] // self.length,
+                           np.hypot(step[:, 0], step[:, 1]),
+                           minlength=self.n)
+
+    def segments(self, spacing=0):
+        """
+        Indices into vertices() of the line segments joining
+        consecutive points of each trail, oldest to newest.
+        With spacing, every stride-th point of a trail is joined, the
+        stride chosen so that the points are about spacing apart.
+        """
+        t = np.arange(self.length - 1)
+        count = self.count[:self.n, np.newaxis]
+        row = np.arange(self.n)[:, np.newaxis]*self.length
+        stride = 1
+        if spacing:
+            gaps = np.maximum(self.count[:self.n] - 1, 1)
+            stride = spacing*gaps/np.maximum(self.lengths(), 1e-9)
+            stride = np.clip(stride, 1, self.length).astype(np.int64)
+            stride = stride[:, np.newaxis]
+        valid = (t < count - 1) & (t % stride == 0)
+        # The newest point always ends the trail.
+        oldest = self.head - count
+        start = row + (oldest + t) % self.length
+        end = row + (oldest + np.minimum(t + stride, count - 1)) % self.length
+        return np.c_[start[valid], end[valid]].ravel()